@@ -1,11 +1,61 @@
 DEFAULT_CONFIG = {
+    "storage": {
+        "backend": "mongodb",          # "mongodb" or "embedded" (SQLite plus a memory-mapped embedding file)
+        "embedded_path": "face_store"
+    },
     "mongodb": {
         "connection_uri": "mongodb://localhost:27017/",
         "database_name": "imageProject"
     },
     "face_recognition": {
         "similarity_threshold": 0.95,
-        "confidence_threshold": 0.25
+        "confidence_threshold": 0.25,
+        "model_version": "yolov11l-face/facenet-vggface2"
+    },
+    "duplicate_detection": {
+        "similarity_threshold": 0.8,
+        "block_size": 1024,
+        "refresh_seconds": 30  # minimum time between background refreshes of suggestions
+    },
+    "embedding_storage": {
+        "max_embeddings_per_person": 256,
+        "compaction_strategy": "reservoir"  # "reservoir", "kmedoids" or "centroid"
+    },
+    "identification_service": {
+        "host": "127.0.0.1",
+        "port": 8765,
+        "unix_socket": None,
+        "max_batch_size": 16,
+        "max_wait_ms": 10
+    },
+    "watch": {
+        "poll_interval": 2.0,
+        "debounce_seconds": 2.0,
+        "batch_size": 8
+    },
+    "snapshot": {
+        "path": "embedding_snapshot",
+        "refresh_seconds": 2,
+        "persist_seconds": 300
+    },
+    "gui": {
+        "persons_page_size": 50
+    },
+    "dedup": {
+        "enabled": True,
+        "near_duplicate_distance": 4,  # max differing bits between 64-bit dHashes
+        "policy": "link"  # "link" into the original's folders, "skip", or "separate" into _duplicates
+    },
+    "video": {
+        "extensions": [".mp4", ".mov", ".avi", ".mkv"],
+        "frame_stride": 15,            # always sample every Nth frame
+        "scene_check_interval": 5,     # frames between cheap scene-change checks
+        "scene_change_threshold": 30.0,  # mean absolute gray-level difference that forces a sample
+        "batch_size": 16,              # sampled frames per YOLO call
+        "iou_threshold": 0.3,
+        "max_track_gap": 45,           # frames a track may go undetected before it ends
+        "min_track_length": 2,         # detections needed before a track is identified
+        "frames_per_track": 3          # best crops embedded per track
     }
 }
 
@@ -13,3 +63,35 @@ CONNECTION_URI = DEFAULT_CONFIG['mongodb']['connection_uri']
 DATABASE_NAME = DEFAULT_CONFIG['mongodb']['database_name']
 SIMILARITY_THRESHOLD = DEFAULT_CONFIG['face_recognition']['similarity_threshold']
 CONFIDENCE_THRESHOLD = DEFAULT_CONFIG['face_recognition']['confidence_threshold']
+MODEL_VERSION = DEFAULT_CONFIG['face_recognition']['model_version']
+DUPLICATE_SIMILARITY_THRESHOLD = DEFAULT_CONFIG['duplicate_detection']['similarity_threshold']
+DUPLICATE_BLOCK_SIZE = DEFAULT_CONFIG['duplicate_detection']['block_size']
+DUPLICATE_REFRESH_SECONDS = DEFAULT_CONFIG['duplicate_detection']['refresh_seconds']
+MAX_EMBEDDINGS_PER_PERSON = DEFAULT_CONFIG['embedding_storage']['max_embeddings_per_person']
+COMPACTION_STRATEGY = DEFAULT_CONFIG['embedding_storage']['compaction_strategy']
+SERVICE_HOST = DEFAULT_CONFIG['identification_service']['host']
+SERVICE_PORT = DEFAULT_CONFIG['identification_service']['port']
+SERVICE_UNIX_SOCKET = DEFAULT_CONFIG['identification_service']['unix_socket']
+SERVICE_MAX_BATCH_SIZE = DEFAULT_CONFIG['identification_service']['max_batch_size']
+SERVICE_MAX_WAIT_MS = DEFAULT_CONFIG['identification_service']['max_wait_ms']
+WATCH_POLL_INTERVAL = DEFAULT_CONFIG['watch']['poll_interval']
+WATCH_DEBOUNCE_SECONDS = DEFAULT_CONFIG['watch']['debounce_seconds']
+WATCH_BATCH_SIZE = DEFAULT_CONFIG['watch']['batch_size']
+SNAPSHOT_DIR = DEFAULT_CONFIG['snapshot']['path']
+SNAPSHOT_REFRESH_SECONDS = DEFAULT_CONFIG['snapshot']['refresh_seconds']
+SNAPSHOT_PERSIST_SECONDS = DEFAULT_CONFIG['snapshot']['persist_seconds']
+PERSONS_PAGE_SIZE = DEFAULT_CONFIG['gui']['persons_page_size']
+DEDUP_ENABLED = DEFAULT_CONFIG['dedup']['enabled']
+DEDUP_MAX_DISTANCE = DEFAULT_CONFIG['dedup']['near_duplicate_distance']
+DEDUP_POLICY = DEFAULT_CONFIG['dedup']['policy']
+VIDEO_EXTENSIONS = tuple(DEFAULT_CONFIG['video']['extensions'])
+VIDEO_FRAME_STRIDE = DEFAULT_CONFIG['video']['frame_stride']
+VIDEO_SCENE_CHECK_INTERVAL = DEFAULT_CONFIG['video']['scene_check_interval']
+VIDEO_SCENE_CHANGE_THRESHOLD = DEFAULT_CONFIG['video']['scene_change_threshold']
+VIDEO_BATCH_SIZE = DEFAULT_CONFIG['video']['batch_size']
+VIDEO_IOU_THRESHOLD = DEFAULT_CONFIG['video']['iou_threshold']
+VIDEO_MAX_TRACK_GAP = DEFAULT_CONFIG['video']['max_track_gap']
+VIDEO_MIN_TRACK_LENGTH = DEFAULT_CONFIG['video']['min_track_length']
+VIDEO_FRAMES_PER_TRACK = DEFAULT_CONFIG['video']['frames_per_track']
+STORAGE_BACKEND = DEFAULT_CONFIG['storage']['backend']
+EMBEDDED_STORE_DIR = DEFAULT_CONFIG['storage']['embedded_path']
@@ -1,31 +1,67 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import OperationFailure
 from datetime import datetime
 import torch
 import numpy as np
-from bson import ObjectId
+from bson import ObjectId, Binary
 import json
-from aiModels import DEVICE
-from config import CONNECTION_URI, DATABASE_NAME
+import random
+import re
+import uuid
+from storageBackend import StorageBackend, COMPACTION_STRATEGIES
+from config import CONNECTION_URI, DATABASE_NAME, MAX_EMBEDDINGS_PER_PERSON, COMPACTION_STRATEGY, MODEL_VERSION
 
-class MongoDBManager:
-    def __init__(self, connection_uri=CONNECTION_URI, database_name=DATABASE_NAME):
+# Writers take a version just before writing, so refreshes reread this many recent
+# versions to pick up writes that were still in flight during the previous refresh
+VERSION_OVERLAP = 64
+
+class MongoDBManager(StorageBackend):
+    def __init__(self, connection_uri=CONNECTION_URI, database_name=DATABASE_NAME,
+                 max_embeddings=MAX_EMBEDDINGS_PER_PERSON, compaction_strategy=COMPACTION_STRATEGY):
         """Initialize MongoDB connection with connection pooling."""
+        if compaction_strategy not in COMPACTION_STRATEGIES:
+            raise ValueError(f"Unknown compaction strategy '{compaction_strategy}', expected one of {COMPACTION_STRATEGIES}")
+        self.max_embeddings = max_embeddings
+        self.compaction_strategy = compaction_strategy
+
         try:
             self.client = MongoClient(connection_uri, maxPoolSize=50, minPoolSize=10)
             self.db = self.client[database_name]
+            # One aggregate document per person
             self.faces_collection = self.db.imageData
+            # One document per detected face, linking an image to a person
+            self.face_observations = self.db.faces
+            # Change counter and deleted person IDs used to refresh embedding snapshots incrementally
+            self.meta_collection = self.db.meta
+            self.person_tombstones = self.db.person_tombstones
             
             # Test connection
             self.client.admin.command('ping')
             print("Successfully connected to MongoDB!")
+
+            self._ensure_indexes()
             
         except Exception as e:
             print(f"Error connecting to MongoDB: {e}")
             raise
+
+    def _ensure_indexes(self):
+        """Create the indexes used by person lookups and face observation queries."""
+        try:
+            self.faces_collection.create_index("person_id")
+            self.faces_collection.create_index("name_label")
+            self.faces_collection.create_index("version")
+            self.person_tombstones.create_index("version")
+            # Person-first compound index also serves first-image previews per person
+            self.face_observations.create_index([("person_id", 1), ("_id", 1)])
+            self.face_observations.create_index("image_path")
+        except Exception as e:
+            print(f"Error creating indexes: {e}")
+            raise
     
 # In databaseManager.py
 
-    def save_new_person(self, embedding, name_label=None, image_path=None):
+    def save_new_person(self, embedding, name_label=None, image_path=None, bbox=None, confidence=None):
         """Save a new person to the database."""
         person_id = self.generatePersonID()
 
@@ -35,38 +71,96 @@ class MongoDBManager:
                 "person_id": person_id,
                 "name_label": name_label,
                 "embeddings": [embedding_list],
-                "representative_embedding": embedding_list,  
-                "representative_image_paths": [image_path] if image_path else [] # This line is critical
+                "embedding_sum": embedding_list,
+                "embedding_count": 1,
+                "face_count": 1,
+                "representative_embedding": embedding_list,
+                "version": self._next_version()
             }
             result = self.faces_collection.insert_one(person_doc)
+            self._insert_face(person_id, embedding_list, image_path, bbox, confidence)
             print(f"Successfully saved new person with ID: {person_id}")
             return person_id
         except Exception as e:
             print(f"Error saving new person: {e}")
             raise
 
-    def add_embedding_to_person(self, person_id, embedding, image_path):
-        """Add a new embedding and image path, then rebuild representative embedding."""
+    def add_embedding_to_person(self, person_id, embedding, image_path, bbox=None, confidence=None):
+        """Add a new embedding and image path, then update the representative embedding.
+
+        At most ``max_embeddings`` embeddings are stored per person; beyond that the
+        compaction strategy decides what is kept. The representative embedding is
+        derived from a running sum over every embedding ever added, so it stays exact.
+        The sum, count and stored embeddings are updated in one server-side pipeline,
+        so concurrent writers to the same person do not lose updates.
+        """
         try:
             embedding_list = self._tensor_to_list(embedding)
-            # Push new data
-            self.faces_collection.update_one(
+            doc = self.faces_collection.find_one({"person_id": person_id}, {"embedding_sum": 1})
+            if not doc:
+                raise ValueError(f"Person {person_id} not found")
+            if doc.get("embedding_sum") is None:
+                # Backfill running totals on documents written before they existed
+                self._recompute_representative_embedding(person_id)
+
+            updated = self.faces_collection.find_one_and_update(
                 {"person_id": person_id},
-                {
-                    "$push": {
-                        "embeddings": embedding_list,
-                        "representative_image_paths": image_path
-                    }
-                }
+                self._add_embedding_pipeline(embedding_list, self._next_version()),
+                projection={"stored_count": {"$size": {"$ifNull": ["$embeddings", []]}}},
+                return_document=ReturnDocument.AFTER
             )
-            # Recompute and update representative embedding
-            self._recompute_representative_embedding(person_id)
+            if not updated:
+                raise ValueError(f"Person {person_id} not found")
+            self._insert_face(person_id, embedding_list, image_path, bbox, confidence)
+            if self.compaction_strategy == "kmedoids" and updated["stored_count"] > self.max_embeddings:
+                self.compact_person(person_id)
             print(f"Successfully added embedding and updated representative for {person_id}")
             return True
         except Exception as e:
             print(f"Error adding embedding to person: {e}")
             raise
 
+    def _add_embedding_pipeline(self, embedding_list, version):
+        """Build the update pipeline that folds one embedding into a person document."""
+        stored = {"$ifNull": ["$embeddings", []]}
+        appended = {"$concatArrays": [stored, {"$literal": [embedding_list]}]}
+        if self.compaction_strategy == "reservoir":
+            # Reservoir sampling: every embedding seen so far has equal odds of being stored
+            slot = {"$floor": {"$multiply": [{"$rand": {}}, {"$add": ["$embedding_count", 1]}]}}
+            when_full = {"$let": {"vars": {"slot": slot}, "in": {"$map": {
+                "input": {"$range": [0, {"$size": stored}]},
+                "as": "i",
+                "in": {"$cond": [
+                    {"$eq": ["$$i", "$$slot"]},
+                    {"$literal": embedding_list},
+                    {"$arrayElemAt": [stored, "$$i"]}
+                ]}
+            }}}}
+        elif self.compaction_strategy == "kmedoids":
+            # Compacted by the caller once the cap is exceeded
+            when_full = appended
+        else:
+            when_full = stored
+
+        fields = {
+            "embeddings": {"$cond": [{"$lt": [{"$size": stored}, self.max_embeddings]}, appended, when_full]},
+            "embedding_count": {"$add": ["$embedding_count", 1]},
+            "face_count": {"$add": [{"$ifNull": ["$face_count", 0]}, 1]},
+            "version": {"$literal": version},
+            "embedding_sum": {"$map": {
+                "input": {"$range": [0, {"$size": "$embedding_sum"}]},
+                "as": "i",
+                "in": {"$add": [
+                    {"$arrayElemAt": ["$embedding_sum", "$$i"]},
+                    {"$arrayElemAt": [{"$literal": embedding_list}, "$$i"]}
+                ]}
+            }}
+        }
+        if self.compaction_strategy == "centroid":
+            # "centroid" keeps only the running sum once the count exceeds the cap
+            fields["embeddings"] = {"$cond": [{"$lt": ["$embedding_count", self.max_embeddings]}, appended, []]}
+        return [{"$set": fields}, self._representative_stage()]
+
     def getPerson(self, person_id):
         """Retrieve a person by their ID."""
         try:
@@ -74,11 +168,12 @@ class MongoDBManager:
             if not person:
                 raise ValueError(f"Person {person_id} not found")
             
+            image_paths = self._get_image_paths([person_id]).get(person_id, [])
             return {
                 "name_label": person.get("name_label"),
                 "embeddings": [self._list_to_tensor(emb) for emb in person.get("embeddings", [])],
                 "representative_embedding": self._list_to_tensor(person.get("representative_embedding", [])),
-                "representative_image_paths": person.get("representative_image_paths", [])
+                "representative_image_paths": person.get("representative_image_paths", []) + image_paths
             }
         
         except Exception as e:
@@ -103,73 +198,583 @@ class MongoDBManager:
             raise
 
     def merge_persons(self, target_id, source_ids):
-        """Merge multiple persons into one, then rebuild representative embedding."""
+        """Merge multiple persons into one on the server, then rebuild representative embedding.
+
+        The sources are read, summed and folded into the target by an update pipeline,
+        face observations are reassigned and the sources deleted, all inside one
+        transaction when the deployment supports one; a retried transaction reads the
+        sources again.
+        """
         try:
-            target = self.faces_collection.find_one({"person_id": target_id})
+            source_ids = self._merge_source_ids(target_id, source_ids)
+            target = self.faces_collection.find_one({"person_id": target_id}, {"has_sum": {"$isArray": "$embedding_sum"}})
             if not target:
                 raise ValueError(f"Target person {target_id} not found")
-            sources = list(self.faces_collection.find({"person_id": {"$in": source_ids}}))
-            if len(sources) != len(source_ids):
-                raise ValueError("Some source persons not found")
-            # Combine lists
-            all_embeddings = target.get("embeddings", [])
-            all_paths = target.get("representative_image_paths", [])
-            for source in sources:
-                all_embeddings.extend(source.get("embeddings", []))
-                all_paths.extend(source.get("representative_image_paths", []))
-            # Update target
-            self.faces_collection.update_one(
-                {"person_id": target_id},
-                {"$set": {"embeddings": all_embeddings, "representative_image_paths": all_paths}}
-            )
-            # Remove sources
-            self.faces_collection.delete_many({"person_id": {"$in": source_ids}})
-            # Recompute new representative embedding
-            self._recompute_representative_embedding(target_id)
+            if not target["has_sum"]:
+                # Backfill running totals on documents written before they existed
+                self._recompute_representative_embedding(target_id)
+
+            def apply_merge(session):
+                sources = list(self.faces_collection.find(
+                    {"person_id": {"$in": source_ids}},
+                    {"person_id": 1, "embeddings": 1, "embedding_sum": 1, "embedding_count": 1,
+                     "face_count": 1, "representative_image_paths": 1},
+                    session=session
+                ))
+                if len(sources) != len(source_ids):
+                    raise ValueError("Some source persons not found")
+
+                source_embeddings, source_paths = [], []
+                source_sum, source_count, source_faces = None, 0, 0
+                for source in sources:
+                    source_embeddings.extend(source.get("embeddings", []))
+                    source_paths.extend(source.get("representative_image_paths", []))
+                    embedding_sum, embedding_count = self._get_embedding_totals(source["person_id"], source)
+                    source_sum = embedding_sum if source_sum is None else source_sum + embedding_sum
+                    source_count += embedding_count
+                    source_faces += source.get("face_count", 0)
+
+                version = self._next_version()
+                merged = self.faces_collection.find_one_and_update(
+                    {"person_id": target_id},
+                    self._merge_pipeline(
+                        self._tensor_to_list(source_sum), source_count, source_faces, source_embeddings, source_paths, version
+                    ),
+                    projection={"stored_count": {"$size": {"$ifNull": ["$embeddings", []]}}, "embedding_count": 1},
+                    return_document=ReturnDocument.AFTER,
+                    session=session
+                )
+                if not merged:
+                    raise ValueError(f"Target person {target_id} not found")
+                self.face_observations.update_many(
+                    {"person_id": {"$in": source_ids}},
+                    {"$set": {"person_id": target_id}},
+                    session=session
+                )
+                self.faces_collection.delete_many({"person_id": {"$in": source_ids}}, session=session)
+                self.person_tombstones.insert_many(
+                    [{"person_id": source_id, "version": version} for source_id in source_ids],
+                    session=session
+                )
+                return merged
+
+            merged = self._run_in_transaction(apply_merge)
+            # Keep the merged person within the embedding cap
+            if self._over_cap(merged["stored_count"], merged["embedding_count"]):
+                self.compact_person(target_id)
             print(f"Successfully merged {len(source_ids)} into {target_id} in Database.")
             return True
         except Exception as e:
             print(f"Error merging persons: {e}")
             raise
 
+    def _merge_pipeline(self, source_sum, source_count, source_faces, source_embeddings, source_paths, version):
+        """Build the update pipeline that folds source aggregates into the target document."""
+        merged_fields = {
+            "embeddings": {"$concatArrays": [{"$ifNull": ["$embeddings", []]}, {"$literal": source_embeddings}]},
+            "embedding_count": {"$add": ["$embedding_count", source_count]},
+            "face_count": {"$add": [{"$ifNull": ["$face_count", 0]}, source_faces]},
+            "version": {"$literal": version},
+            "embedding_sum": {"$map": {
+                "input": {"$range": [0, {"$size": "$embedding_sum"}]},
+                "as": "i",
+                "in": {"$add": [
+                    {"$arrayElemAt": ["$embedding_sum", "$$i"]},
+                    {"$arrayElemAt": [{"$literal": source_sum}, "$$i"]}
+                ]}
+            }}
+        }
+        if source_paths:
+            # Only documents not yet migrated to the faces collection carry paths
+            merged_fields["representative_image_paths"] = {
+                "$concatArrays": [{"$ifNull": ["$representative_image_paths", []]}, {"$literal": source_paths}]
+            }
+        return [{"$set": merged_fields}, self._representative_stage()]
+
+    def _representative_stage(self):
+        """Pipeline stage setting the representative to the L2-normalized running sum."""
+        representative = {"$let": {
+            "vars": {"norm": {"$sqrt": {"$reduce": {
+                "input": "$embedding_sum",
+                "initialValue": 0,
+                "in": {"$add": ["$$value", {"$multiply": ["$$this", "$$this"]}]}
+            }}}},
+            "in": {"$map": {"input": "$embedding_sum", "as": "v", "in": {"$divide": ["$$v", "$$norm"]}}}
+        }}
+        return {"$set": {"representative_embedding": representative}}
+
+    def _run_in_transaction(self, operation):
+        """Run operation(session) in a transaction, or without one on standalone servers."""
+        with self.client.start_session() as session:
+            try:
+                return session.with_transaction(operation)
+            except OperationFailure as e:
+                # Standalone servers reject transactions with IllegalOperation (code 20)
+                if e.code != 20:
+                    raise
+        return operation(None)
+
+    def count_persons(self, search=None):
+        """Count persons, optionally only those whose name or ID starts with search."""
+        try:
+            return self.faces_collection.count_documents(self._search_query(search))
+        except Exception as e:
+            print(f"Error counting persons: {e}")
+            raise
+
+    def get_persons_page(self, page=0, page_size=50, search=None, after_person_id=None):
+        """Return one page of lightweight person rows ordered by person ID.
+
+        Rows hold person_id, name_label, image_count and preview_image_path; no embeddings
+        are loaded. Pass after_person_id (the last ID of the previous page) to page with an
+        indexed range query instead of skipping.
+        """
+        try:
+            query = self._search_query(search)
+            if after_person_id is not None:
+                query = {"$and": [query, {"person_id": {"$gt": after_person_id}}]}
+            cursor = self.faces_collection.find(query, self._ROW_PROJECTION).sort("person_id", 1)
+            if after_person_id is None and page:
+                cursor = cursor.skip(page * page_size)
+            return self._person_rows(cursor.limit(page_size))
+        except Exception as e:
+            print(f"Error retrieving persons page: {e}")
+            raise
+
+    def get_person_rows(self, person_ids):
+        """Return lightweight rows (as in get_persons_page) for the given IDs, keyed by person ID."""
+        try:
+            cursor = self.faces_collection.find({"person_id": {"$in": list(person_ids)}}, self._ROW_PROJECTION)
+            return {row["person_id"]: row for row in self._person_rows(cursor)}
+        except Exception as e:
+            print(f"Error retrieving person rows: {e}")
+            raise
+
+    def get_total_image_count(self):
+        """Total number of face images managed across all persons."""
+        try:
+            pipeline = [{"$group": {"_id": None, "total": {"$sum": {"$add": [
+                {"$ifNull": ["$face_count", 0]},
+                {"$size": {"$ifNull": ["$representative_image_paths", []]}}
+            ]}}}}]
+            result = list(self.faces_collection.aggregate(pipeline))
+            return result[0]["total"] if result else 0
+        except Exception as e:
+            print(f"Error counting images: {e}")
+            raise
+
+    _ROW_PROJECTION = {
+        "person_id": 1,
+        "name_label": 1,
+        "face_count": 1,
+        "legacy_preview": {"$arrayElemAt": [{"$ifNull": ["$representative_image_paths", []]}, 0]},
+        "legacy_count": {"$size": {"$ifNull": ["$representative_image_paths", []]}}
+    }
+
+    def _search_query(self, search):
+        """Anchored, case-sensitive prefix match on name_label or person_id, which can use their indexes."""
+        if not search:
+            return {}
+        prefix = {"$regex": "^" + re.escape(search)}
+        return {"$or": [{"name_label": prefix}, {"person_id": prefix}]}
+
+    def _person_rows(self, docs):
+        """Build display rows, fetching one preview image per person in a single query."""
+        docs = list(docs)
+        person_ids = [doc["person_id"] for doc in docs]
+        pipeline = [
+            {"$match": {"person_id": {"$in": person_ids}, "image_path": {"$ne": None}}},
+            {"$sort": {"person_id": 1, "_id": 1}},
+            {"$group": {"_id": "$person_id", "image_path": {"$first": "$image_path"}}}
+        ]
+        previews = {group["_id"]: group["image_path"] for group in self.face_observations.aggregate(pipeline)} if docs else {}
+
+        rows = []
+        for doc in docs:
+            rows.append({
+                "person_id": doc["person_id"],
+                "name_label": doc.get("name_label"),
+                "image_count": doc.get("face_count", 0) + doc.get("legacy_count", 0),
+                "preview_image_path": doc.get("legacy_preview") or previews.get(doc["person_id"])
+            })
+        return rows
+
+    def get_person_labels(self, person_ids):
+        """Return {person_id: name_label} for the given IDs without loading any embeddings."""
+        try:
+            cursor = self.faces_collection.find(
+                {"person_id": {"$in": list(person_ids)}},
+                {"person_id": 1, "name_label": 1}
+            )
+            return {doc["person_id"]: doc.get("name_label") for doc in cursor}
+        except Exception as e:
+            print(f"Error retrieving person labels: {e}")
+            raise
+
     def get_all_persons(self):
         """Retrieve all persons from the database."""
         try:
             persons = {}
+            image_paths = self._get_image_paths()
             for doc in self.faces_collection.find({}):
                 person_id = doc["person_id"]
                 persons[person_id] = {
                     "name_label": doc.get("name_label"),
                     "embeddings": [self._list_to_tensor(emb) for emb in doc.get("embeddings", [])],
                     "representative_embedding": self._list_to_tensor(doc.get("representative_embedding", [])),
-                    "representative_image_paths": doc.get("representative_image_paths", [])
+                    "representative_image_paths": doc.get("representative_image_paths", []) + image_paths.get(person_id, [])
                 }
             return persons
         except Exception as e:
             print(f"Error retrieving persons: {e}")
             raise
 
+    def get_faces_in_image(self, image_path):
+        """Return every face observation recorded for an image."""
+        try:
+            faces = []
+            cursor = self.face_observations.find({"image_path": image_path}, {"embedding": 0}).sort("_id", 1)
+            for face in cursor:
+                faces.append({
+                    "face_id": face["_id"],
+                    "person_id": face.get("person_id"),
+                    "bbox": face.get("bbox"),
+                    "confidence": face.get("confidence"),
+                    "model_version": face.get("model_version")
+                })
+            return faces
+        except Exception as e:
+            print(f"Error retrieving faces for image {image_path}: {e}")
+            raise
+
+    def remove_face(self, face_id):
+        """Remove one face observation and take its embedding out of the person's aggregates."""
+        try:
+            face = self.face_observations.find_one({"_id": ObjectId(face_id)})
+            if not face:
+                raise ValueError(f"Face {face_id} not found")
+            person_id = face["person_id"]
+
+            doc = self.faces_collection.find_one(
+                {"person_id": person_id},
+                {"has_sum": {"$isArray": "$embedding_sum"},
+                 "legacy_paths": {"$size": {"$ifNull": ["$representative_image_paths", []]}}}
+            )
+            self.face_observations.delete_one({"_id": face["_id"]})
+            if not doc:
+                return True
+
+            if not doc["legacy_paths"] and not self.face_observations.count_documents({"person_id": person_id}, limit=1):
+                self.faces_collection.delete_one({"person_id": person_id})
+                self.person_tombstones.insert_one({"person_id": person_id, "version": self._next_version()})
+                print(f"Removed face {face_id} and its now empty person {person_id}")
+                return True
+
+            if face.get("embedding") is not None:
+                if not doc["has_sum"]:
+                    # Backfill running totals on documents written before they existed
+                    self._recompute_representative_embedding(person_id)
+                update = self._remove_embedding_pipeline(self._binary_to_list(face["embedding"]), self._next_version())
+            else:
+                update = {"$inc": {"face_count": -1}}
+                print(f"Face {face_id} has no stored embedding; representative of {person_id} left unchanged")
+            self.faces_collection.update_one({"person_id": person_id}, update)
+            print(f"Removed face {face_id} from person {person_id}")
+            return True
+        except Exception as e:
+            print(f"Error removing face {face_id}: {e}")
+            raise
+
+    def _remove_embedding_pipeline(self, embedding_list, version):
+        """Build the update pipeline that takes one face's embedding out of a person document."""
+        fields = {
+            # float32 round trip matches the stored list exactly, so the prototype is found if kept
+            "embeddings": {"$filter": {
+                "input": {"$ifNull": ["$embeddings", []]},
+                "as": "e",
+                "cond": {"$ne": ["$$e", {"$literal": embedding_list}]}
+            }},
+            "embedding_count": {"$max": [{"$add": ["$embedding_count", -1]}, 1]},
+            "face_count": {"$add": [{"$ifNull": ["$face_count", 0]}, -1]},
+            "version": {"$literal": version},
+            "embedding_sum": {"$map": {
+                "input": {"$range": [0, {"$size": "$embedding_sum"}]},
+                "as": "i",
+                "in": {"$subtract": [
+                    {"$arrayElemAt": ["$embedding_sum", "$$i"]},
+                    {"$arrayElemAt": [{"$literal": embedding_list}, "$$i"]}
+                ]}
+            }}
+        }
+        return [{"$set": fields}, self._representative_stage()]
+
+    def copy_faces_to_image(self, original_path, duplicate_path):
+        """Record a duplicate image as showing the same faces as its original.
+
+        The copies carry no embedding, so person embeddings and representatives are left
+        untouched; returns the person IDs found in the original.
+        """
+        try:
+            faces = list(self.face_observations.find({"image_path": original_path}, {"embedding": 0}))
+            if not faces:
+                return []
+            copies = []
+            per_person = {}
+            for face in faces:
+                copy = self._face_document(face["person_id"], None, duplicate_path, face.get("bbox"), face.get("confidence"))
+                copy["duplicate_of"] = original_path
+                copies.append(copy)
+                per_person[face["person_id"]] = per_person.get(face["person_id"], 0) + 1
+            self.face_observations.insert_many(copies)
+            for person_id, count in per_person.items():
+                self.faces_collection.update_one({"person_id": person_id}, {"$inc": {"face_count": count}})
+            return list(per_person)
+        except Exception as e:
+            print(f"Error copying faces from {original_path} to {duplicate_path}: {e}")
+            raise
+
+    def migrate_to_face_collection(self):
+        """Move per-person image path arrays into one face observation per detection.
+
+        Each person is migrated in a transaction where supported. Inserted faces are
+        tagged, and a rerun first deletes the tagged faces of persons that still hold
+        their path array, so an interrupted migration never duplicates faces.
+        """
+        migrated = 0
+        query = {"representative_image_paths": {"$exists": True}}
+        for doc in self.faces_collection.find(query):
+            person_id = doc["person_id"]
+            embeddings = doc.get("embeddings", [])
+            paths = doc.get("representative_image_paths", [])
+            # The first embeddings pair positionally with the paths; faces recorded since the
+            # upgrade appended theirs behind them. Compaction breaks the pairing.
+            paired = doc.get("embedding_count", len(embeddings)) == len(embeddings) and len(embeddings) >= len(paths)
+            faces = []
+            for i, path in enumerate(paths):
+                face = self._face_document(person_id, embeddings[i] if paired else None, path, None, None)
+                face["migrated"] = True
+                faces.append(face)
+            if doc.get("embedding_sum") is None:
+                self._recompute_representative_embedding(person_id)
+
+            def migrate_person(session):
+                # Leftovers of an interrupted earlier run
+                self.face_observations.delete_many({"person_id": person_id, "migrated": True}, session=session)
+                if faces:
+                    self.face_observations.insert_many([dict(face) for face in faces], session=session)
+                # Faces recorded since this release are already in the collection
+                face_count = self.face_observations.count_documents({"person_id": person_id}, session=session)
+                self.faces_collection.update_one(
+                    {"person_id": person_id},
+                    {
+                        "$set": {"face_count": face_count},
+                        "$unset": {"representative_image_paths": ""}
+                    },
+                    session=session
+                )
+
+            self._run_in_transaction(migrate_person)
+            migrated += 1
+        print(f"Migrated {migrated} person document(s) to the faces collection.")
+        return migrated
+
+    def _insert_face(self, person_id, embedding_list, image_path, bbox, confidence):
+        """Record a single face observation."""
+        self.face_observations.insert_one(self._face_document(person_id, embedding_list, image_path, bbox, confidence))
+
+    def _face_document(self, person_id, embedding_list, image_path, bbox, confidence):
+        """Build a face observation document with a compact float32 embedding."""
+        return {
+            "person_id": person_id,
+            "image_path": image_path,
+            "bbox": [int(v) for v in bbox] if bbox is not None else None,
+            "embedding": self._list_to_binary(embedding_list) if embedding_list is not None else None,
+            "confidence": float(confidence) if confidence is not None else None,
+            "model_version": MODEL_VERSION,
+            "created_at": datetime.now()
+        }
+
+    def _get_image_paths(self, person_ids=None):
+        """Group observed image paths by person, in insertion order."""
+        pipeline = []
+        if person_ids is not None:
+            pipeline.append({"$match": {"person_id": {"$in": list(person_ids)}}})
+        pipeline += [
+            {"$match": {"image_path": {"$ne": None}}},
+            {"$sort": {"_id": 1}},
+            {"$group": {"_id": "$person_id", "paths": {"$push": "$image_path"}}}
+        ]
+        return {group["_id"]: group["paths"] for group in self.face_observations.aggregate(pipeline)}
+
+    def get_representative_embedding(self, person_id):
+        """Retrieve a single person's representative embedding, or None if the person does not exist."""
+        try:
+            doc = self.faces_collection.find_one({"person_id": person_id}, {"representative_embedding": 1})
+            if not doc or not doc.get("representative_embedding"):
+                return None
+            return self._list_to_tensor(doc["representative_embedding"])
+        except Exception as e:
+            print(f"Error retrieving representative embedding: {e}")
+            raise
+
+    def get_representative_changes(self, since_version=0):
+        """Return (changed, deleted, version) for snapshot refreshes.
+
+        changed maps person IDs to representative embedding lists written after
+        since_version (everything when it is 0), deleted lists person IDs removed since
+        then, and version is the change counter to resume from next time.
+        """
+        try:
+            counter = self.meta_collection.find_one({"_id": "embedding_version"})
+            version = counter["value"] if counter else 0
+
+            floor = max(since_version - VERSION_OVERLAP, 0)
+            query = {"version": {"$gt": floor}} if since_version else {}
+            changed = {}
+            for doc in self.faces_collection.find(query, {"person_id": 1, "representative_embedding": 1}):
+                if doc.get("representative_embedding"):
+                    changed[doc["person_id"]] = doc["representative_embedding"]
+
+            deleted = []
+            if since_version:
+                deleted = [tombstone["person_id"] for tombstone in
+                           self.person_tombstones.find({"version": {"$gt": floor}}, {"person_id": 1})]
+            return changed, deleted, version
+        except Exception as e:
+            print(f"Error retrieving representative changes: {e}")
+            raise
+
+    def get_store_id(self):
+        """Return the random ID of this database, created on first use."""
+        try:
+            doc = self.meta_collection.find_one_and_update(
+                {"_id": "store_id"},
+                {"$setOnInsert": {"value": uuid.uuid4().hex}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return f"mongodb:{doc['value']}"
+        except Exception as e:
+            print(f"Error retrieving store ID: {e}")
+            raise
+
+    def _next_version(self):
+        """Advance the global change counter used by embedding snapshots."""
+        counter = self.meta_collection.find_one_and_update(
+            {"_id": "embedding_version"},
+            {"$inc": {"value": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter["value"]
 
     def _recompute_representative_embedding(self, person_id):
-        """Recompute representative embedding as the normalized average of all embeddings."""
-        doc = self.faces_collection.find_one({"person_id": person_id}, {"embeddings": 1})
-        if not doc or "embeddings" not in doc:
-            raise ValueError(f"Person {person_id} not found or has no embeddings")
+        """Backfill running totals and the representative from the embeddings of a legacy document."""
+        doc = self.faces_collection.find_one({"person_id": person_id}, {"embeddings": 1, "embedding_sum": 1})
+        if not doc:
+            raise ValueError(f"Person {person_id} not found")
+        if doc.get("embedding_sum") is not None:
+            return
 
-        # Convert lists to tensors and stack
-        tensors = [self._list_to_tensor(e) for e in doc["embeddings"]]
-        stacked = torch.stack(tensors, dim=0).float()
-        # Compute centroid
-        centroid = torch.mean(stacked, dim=0)
-        # Normalize
-        rep_embed = torch.nn.functional.normalize(centroid, p=2, dim=0)
-        rep_list = self._tensor_to_list(rep_embed)
-        # Update
+        embedding_sum, embedding_count = self._get_embedding_totals(person_id, doc)
+        # Another writer may have backfilled and added since; its totals win
         self.faces_collection.update_one(
-            {"person_id": person_id},
-            {"$set": {"representative_embedding": rep_list}}
+            {"person_id": person_id, "embedding_sum": {"$exists": False}},
+            {"$set": self._totals_fields(embedding_sum, embedding_count)}
         )
 
+    def _get_embedding_totals(self, person_id, doc):
+        """Return (embedding_sum, embedding_count) for a person document.
+
+        Documents written before running totals existed still hold every embedding,
+        so their totals are rebuilt exactly from the stored list.
+        """
+        if doc.get("embedding_sum") is not None:
+            return self._list_to_tensor(doc["embedding_sum"]).float(), doc.get("embedding_count", 0)
+
+        embeddings = doc.get("embeddings")
+        if embeddings is None:
+            legacy = self.faces_collection.find_one({"person_id": person_id}, {"embeddings": 1})
+            embeddings = legacy.get("embeddings") if legacy else None
+        if not embeddings:
+            raise ValueError(f"Person {person_id} not found or has no embeddings")
+
+        stacked = torch.stack([self._list_to_tensor(e) for e in embeddings], dim=0).float()
+        return stacked.sum(dim=0), len(embeddings)
+
+    def _totals_fields(self, embedding_sum, embedding_count):
+        """Build the running-total fields and the representative embedding derived from them."""
+        # Normalizing the sum equals normalizing the mean
+        rep_embed = torch.nn.functional.normalize(embedding_sum, p=2, dim=0)
+        return {
+            "embedding_sum": self._tensor_to_list(embedding_sum),
+            "embedding_count": embedding_count,
+            "representative_embedding": self._tensor_to_list(rep_embed),
+            "version": self._next_version()
+        }
+
+    def compact_person(self, person_id, strategy=None, attempts=5):
+        """Shrink a person's stored embeddings to the cap; the representative is left unchanged.
+
+        Only the stored list is replaced, and only if the person's version is still the
+        one read, so an embedding added concurrently is never dropped from the list or
+        the running totals; a changed person is read again and compaction retried.
+        """
+        strategy = strategy or self.compaction_strategy
+        try:
+            backfilled = False
+            for _ in range(attempts):
+                doc = self.faces_collection.find_one(
+                    {"person_id": person_id},
+                    {"embeddings": 1, "embedding_sum": 1, "embedding_count": 1, "version": 1}
+                )
+                if not doc:
+                    raise ValueError(f"Person {person_id} not found")
+                if doc.get("embedding_sum") is None:
+                    # Totals must be captured before any embedding is dropped
+                    self._recompute_representative_embedding(person_id)
+                    backfilled = True
+                    continue
+
+                embeddings = doc.get("embeddings", [])
+                if not self._over_cap(len(embeddings), doc.get("embedding_count", 0), strategy):
+                    return backfilled
+                if strategy == "reservoir":
+                    kept = random.sample(embeddings, self.max_embeddings)
+                elif strategy == "kmedoids":
+                    kept = self._kmedoid_prototypes(embeddings, max(1, self.max_embeddings // 2))
+                elif strategy == "centroid":
+                    kept = []
+                else:
+                    raise ValueError(f"Unknown compaction strategy '{strategy}'")
+
+                result = self.faces_collection.update_one(
+                    {"person_id": person_id, "version": doc.get("version")},
+                    {"$set": {"embeddings": kept}}
+                )
+                if result.matched_count:
+                    print(f"Compacted {person_id} from {len(embeddings)} to {len(kept)} stored embeddings")
+                    return True
+            print(f"Person {person_id} kept changing during compaction; left for the next run")
+            return backfilled
+        except Exception as e:
+            print(f"Error compacting person {person_id}: {e}")
+            raise
+
+    def compact_all_persons(self, strategy=None):
+        """Compact every person over the embedding cap and backfill missing running totals."""
+        query = {"$or": [
+            {"embedding_sum": {"$exists": False}},
+            {"$expr": {"$gt": [{"$size": {"$ifNull": ["$embeddings", []]}}, self.max_embeddings]}}
+        ]}
+        if (strategy or self.compaction_strategy) == "centroid":
+            query["$or"].append({"embedding_count": {"$gt": self.max_embeddings}, "embeddings.0": {"$exists": True}})
+        compacted = 0
+        for doc in self.faces_collection.find(query, {"person_id": 1}):
+            if self.compact_person(doc["person_id"], strategy):
+                compacted += 1
+        return compacted
+
     def generatePersonID(self):
         """Generate a unique person ID using timestamp and random string."""
         try:
@@ -191,28 +796,13 @@ class MongoDBManager:
             print(f"Error generating person ID: {e}")
             raise
 
-    def _tensor_to_list(self, tensor):
-        """Convert a PyTorch tensor to a list for MongoDB storage."""
-        try:
-            if isinstance(tensor, torch.Tensor):
-                return tensor.cpu().numpy().tolist()
-            elif isinstance(tensor, np.ndarray):
-                return tensor.tolist()
-            elif isinstance(tensor, list):
-                return tensor
-            else:
-                raise ValueError(f"Unsupported tensor type: {type(tensor)}")
-        except Exception as e:
-            print(f"Error converting tensor to list: {e}")
-            raise
+    def _list_to_binary(self, lst):
+        """Pack an embedding list as float32 bytes for compact storage."""
+        return Binary(np.asarray(lst, dtype=np.float32).tobytes())
 
-    def _list_to_tensor(self, lst):
-        """Convert a list from MongoDB to a PyTorch tensor."""
-        try:
-            return torch.tensor(lst, device=DEVICE)
-        except Exception as e:
-            print(f"Error converting list to tensor: {e}")
-            raise 
+    def _binary_to_list(self, data):
+        """Unpack float32 bytes written by _list_to_binary."""
+        return np.frombuffer(data, dtype=np.float32).tolist()
 
     def close(self):
         """Safely close the MongoDB connection."""
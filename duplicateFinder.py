@@ -0,0 +1,156 @@
+# Background detection of persons that were split into several IDs
+import threading
+import time
+import numpy as np
+import torch
+from config import DUPLICATE_SIMILARITY_THRESHOLD, DUPLICATE_BLOCK_SIZE, DUPLICATE_REFRESH_SECONDS
+
+def _pair_key(person_a, person_b):
+    """Order a pair of person IDs so each pair has a single cache key."""
+    return (person_a, person_b) if person_a < person_b else (person_b, person_a)
+
+class DuplicateFinder:
+    def __init__(self, db_manager, similarity_threshold=DUPLICATE_SIMILARITY_THRESHOLD, block_size=DUPLICATE_BLOCK_SIZE,
+                 refresh_seconds=DUPLICATE_REFRESH_SECONDS):
+        """Keep a cache of likely duplicate pairs between representative embeddings."""
+        self.db_manager = db_manager
+        self.similarity_threshold = similarity_threshold
+        self.block_size = block_size
+        self.refresh_seconds = refresh_seconds
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._embeddings = {}  # person_id -> normalized representative embedding used for the cached pairs
+        self._pairs = {}       # (person_a, person_b) -> cosine similarity
+        self._version = 0      # change counter the cache is current with
+        self._refreshed_at = None
+        self.last_error = None
+
+    def refresh(self):
+        """Bring the cached pairs up to date, fetching and rescoring only changed persons."""
+        with self._lock:
+            since_version = self._version
+            cached = dict(self._embeddings)
+            pairs = dict(self._pairs)
+
+        changes, deleted, version = self.db_manager.get_representative_changes(since_version)
+
+        # Persons whose representative moved (new persons, merge targets) need their row rescored.
+        # Renames keep the embedding unchanged and therefore cost nothing here.
+        current = dict(cached)
+        changed = []
+        for pid, embedding in changes.items():
+            vector = torch.nn.functional.normalize(
+                torch.as_tensor(np.asarray(embedding, dtype=np.float32)).reshape(-1), p=2, dim=0
+            )
+            # Backends may resend recently written persons; only real changes are rescored
+            if pid not in cached or not torch.allclose(cached[pid], vector, atol=1e-6):
+                current[pid] = vector
+                changed.append(pid)
+        removed = {pid for pid in deleted if pid in current}
+        for pid in removed:
+            del current[pid]
+        stale = removed.union(changed)
+
+        if stale:
+            pairs = {key: sim for key, sim in pairs.items() if key[0] not in stale and key[1] not in stale}
+
+        if current and changed:
+            all_ids = list(current.keys())
+            all_matrix = self._stack(current, all_ids)
+            if not cached:
+                pairs.update(self._scan(all_ids, all_matrix, all_ids, all_matrix, upper_only=True))
+            else:
+                changed_matrix = self._stack(current, changed)
+                pairs.update(self._scan(changed, changed_matrix, all_ids, all_matrix, upper_only=False))
+
+        with self._lock:
+            self._embeddings = current
+            self._pairs = pairs
+            self._version = max(since_version, version)
+
+    def refresh_async(self, force=False):
+        """Start a background refresh unless one is running or the last one is under refresh_seconds old."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            if not force and self._refreshed_at is not None and time.monotonic() - self._refreshed_at < self.refresh_seconds:
+                return False
+            self._thread = threading.Thread(target=self._run_refresh, daemon=True)
+            self._thread.start()
+            return True
+
+    def is_running(self):
+        """Return True while a background refresh is in progress."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_pairs(self):
+        """Return cached duplicate pairs ranked by similarity (highest first)."""
+        with self._lock:
+            ranked = sorted(self._pairs.items(), key=lambda item: item[1], reverse=True)
+        return [{"person_ids": list(key), "similarity": sim} for key, sim in ranked]
+
+    def get_groups(self):
+        """Group cached pairs into cliques, where every two members are above the threshold.
+
+        Groups are grown greedily from the strongest unused pair, and each person joins at
+        most one group. A chain A~B~C where A and C are not similar yields the pair A/B
+        only, never a group that would merge A with C. "similarity" is the weakest pair.
+        """
+        with self._lock:
+            pairs = dict(self._pairs)
+
+        neighbours = {}
+        for (person_a, person_b), sim in pairs.items():
+            neighbours.setdefault(person_a, {})[person_b] = sim
+            neighbours.setdefault(person_b, {})[person_a] = sim
+
+        grouped, groups = set(), []
+        for (person_a, person_b), sim in sorted(pairs.items(), key=lambda item: item[1], reverse=True):
+            if person_a in grouped or person_b in grouped:
+                continue
+            members, weakest = [person_a, person_b], sim
+            candidates = sorted(neighbours[person_a].items(), key=lambda item: item[1], reverse=True)
+            for candidate, _ in candidates:
+                if candidate in grouped or candidate in members:
+                    continue
+                links = [neighbours[candidate].get(member) for member in members]
+                if all(link is not None for link in links):
+                    members.append(candidate)
+                    weakest = min([weakest] + links)
+            grouped.update(members)
+            groups.append({"person_ids": sorted(members), "similarity": weakest})
+        return groups
+
+    def _run_refresh(self):
+        """Thread entry point for refresh_async."""
+        try:
+            self.refresh()
+            self.last_error = None
+            self._refreshed_at = time.monotonic()
+        except Exception as e:
+            print(f"Error computing duplicate suggestions: {e}")
+            self.last_error = e
+
+    def _stack(self, embeddings, person_ids):
+        """Stack the embeddings of person_ids into a normalized (N, D) matrix."""
+        stacked = torch.stack([embeddings[pid] for pid in person_ids], dim=0).float()
+        return torch.nn.functional.normalize(stacked, p=2, dim=1)
+
+    def _scan(self, row_ids, row_matrix, col_ids, col_matrix, upper_only):
+        """Blocked similarity scan; only a block_size x block_size tile is held in memory."""
+        pairs = {}
+        for r0 in range(0, len(row_ids), self.block_size):
+            rows = row_matrix[r0:r0 + self.block_size]
+            c_begin = r0 if upper_only else 0
+            for c0 in range(c_begin, len(col_ids), self.block_size):
+                sims = rows @ col_matrix[c0:c0 + self.block_size].T
+                hits = (sims >= self.similarity_threshold).nonzero(as_tuple=False)
+                for i, j in hits.tolist():
+                    if upper_only and r0 + i >= c0 + j:
+                        continue
+                    person_a, person_b = row_ids[r0 + i], col_ids[c0 + j]
+                    if person_a == person_b:
+                        continue
+                    pairs[_pair_key(person_a, person_b)] = sims[i, j].item()
+        return pairs
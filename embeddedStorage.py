@@ -0,0 +1,809 @@
+# Embedded single-node storage: SQLite for metadata, memory-mapped float32 segment files for embeddings
+import os
+import json
+import random
+import secrets
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+from storageBackend import StorageBackend, COMPACTION_STRATEGIES
+from config import EMBEDDED_STORE_DIR, MAX_EMBEDDINGS_PER_PERSON, COMPACTION_STRATEGY, MODEL_VERSION
+
+DATABASE_FILENAME = "store.sqlite3"
+EMBEDDINGS_DIRNAME = "embeddings"
+# Rows per segment file: 8 MiB for 512-dimensional embeddings
+SEGMENT_ROWS = 4096
+# Stay below SQLite's default limit on bound parameters per statement
+IN_CHUNK_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS persons (
+    person_id TEXT PRIMARY KEY,
+    name_label TEXT,
+    sum_row INTEGER NOT NULL,
+    embedding_count INTEGER NOT NULL,
+    face_count INTEGER NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS persons_name_label ON persons (name_label);
+CREATE INDEX IF NOT EXISTS persons_version ON persons (version);
+CREATE TABLE IF NOT EXISTS prototypes (
+    person_id TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    matrix_row INTEGER NOT NULL,
+    PRIMARY KEY (person_id, slot)
+);
+CREATE TABLE IF NOT EXISTS faces (
+    face_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    person_id TEXT NOT NULL,
+    image_path TEXT,
+    bbox TEXT,
+    embedding BLOB,
+    confidence REAL,
+    model_version TEXT,
+    duplicate_of TEXT,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS faces_person ON faces (person_id, face_id);
+CREATE INDEX IF NOT EXISTS faces_image_path ON faces (image_path);
+CREATE TABLE IF NOT EXISTS person_tombstones (
+    person_id TEXT NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS person_tombstones_version ON person_tombstones (version);
+CREATE TABLE IF NOT EXISTS free_rows (
+    matrix_row INTEGER PRIMARY KEY,
+    pending INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+class EmbeddingMatrix:
+    def __init__(self, directory):
+        """float32 matrix in fixed-size memory-mapped segment files, addressed by row index.
+
+        Segments are created at full size and never resized, so growing the matrix never
+        touches a file that this or another process has mapped (Windows refuses to resize
+        a mapped file). The mappings are shared, so rows written by one process are visible
+        to every other process mapping the same files without a copy.
+        """
+        self.directory = directory
+        self.dim = None
+        self._segments = {}
+        self._dirty = set()   # segments written since the last flush
+
+    def open(self, dim):
+        """Set the row width and create the segment directory if needed."""
+        self.dim = dim
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _segment(self, index):
+        """Map one segment, creating its file on first use."""
+        segment = self._segments.get(index)
+        if segment is None:
+            path = os.path.join(self.directory, f"segment_{index:05d}.f32")
+            size = SEGMENT_ROWS * self.dim * 4
+            if not os.path.exists(path) or os.path.getsize(path) < size:
+                # Only writers create segments, and they hold the SQLite write lock
+                with open(path, "ab") as f:
+                    f.truncate(size)
+            segment = np.memmap(path, dtype=np.float32, mode="r+", shape=(SEGMENT_ROWS, self.dim))
+            self._segments[index] = segment
+        return segment
+
+    def read(self, rows):
+        """Copy the given rows out of the mapping as an (N, dim) array."""
+        if self.dim is None or not len(rows):
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        rows = np.asarray(rows, dtype=np.int64)
+        result = np.empty((len(rows), self.dim), dtype=np.float32)
+        segments = rows // SEGMENT_ROWS
+        for index in np.unique(segments):
+            selected = segments == index
+            result[selected] = self._segment(int(index))[rows[selected] % SEGMENT_ROWS]
+        return result
+
+    def write(self, row, vector):
+        """Write one row."""
+        index = row // SEGMENT_ROWS
+        self._segment(index)[row % SEGMENT_ROWS] = vector
+        self._dirty.add(index)
+
+    def flush(self):
+        """Write the segments changed since the last flush to disk."""
+        for index in self._dirty:
+            self._segments[index].flush()
+        self._dirty.clear()
+
+    def close(self):
+        """Flush dirty pages and drop the mappings."""
+        self.flush()
+        self._segments = {}
+
+class EmbeddedStorage(StorageBackend):
+    def __init__(self, store_dir=EMBEDDED_STORE_DIR, max_embeddings=MAX_EMBEDDINGS_PER_PERSON,
+                 compaction_strategy=COMPACTION_STRATEGY):
+        """Open (or create) an embedded store in store_dir.
+
+        Person metadata, face observations and change versions live in SQLite. Running
+        embedding sums and stored prototypes live in one memory-mapped float32 matrix,
+        referenced from SQLite by row. Matrix rows are copy-on-write: a change writes a
+        new row and frees the old one, and freed rows only become reusable once the freeing
+        transaction has committed, so a rolled-back write never corrupts committed data.
+        """
+        if compaction_strategy not in COMPACTION_STRATEGIES:
+            raise ValueError(f"Unknown compaction strategy '{compaction_strategy}', expected one of {COMPACTION_STRATEGIES}")
+        self.max_embeddings = max_embeddings
+        self.compaction_strategy = compaction_strategy
+        self.store_dir = store_dir
+
+        try:
+            os.makedirs(store_dir, exist_ok=True)
+            # Transactions are explicit; the lock serializes threads sharing the connection
+            self.conn = sqlite3.connect(os.path.join(store_dir, DATABASE_FILENAME), isolation_level=None,
+                                        check_same_thread=False, timeout=30)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+            # Random identity of this store, written once
+            self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('store_id', ?)", (secrets.randbits(62) + 1,))
+            self._lock = threading.RLock()
+            self._freed_rows = []
+            # Rows freed by a transaction that committed just before a crash
+            self.conn.execute("UPDATE free_rows SET pending = 0 WHERE pending = 1")
+
+            self.matrix = EmbeddingMatrix(os.path.join(store_dir, EMBEDDINGS_DIRNAME))
+            self._open_matrix(self.conn)
+            print(f"Opened embedded store at '{store_dir}'.")
+        except Exception as e:
+            print(f"Error opening embedded store: {e}")
+            raise
+
+    @contextmanager
+    def _transaction(self, write=True):
+        """Run a block in one SQLite transaction; write transactions take the write lock up front."""
+        with self._lock:
+            self._freed_rows = []
+            self.conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                if self.matrix.dim is None:
+                    # Another process may have written the first embedding since we opened
+                    self._open_matrix(self.conn)
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                self._freed_rows = []
+                raise
+            # Rows must be on disk before SQLite commits references to them
+            self.matrix.flush()
+            self.conn.execute("COMMIT")
+            if self._freed_rows:
+                # Committed data no longer references these rows, so they may now be overwritten
+                for chunk, placeholders in self._chunked(self._freed_rows):
+                    self.conn.execute(f"UPDATE free_rows SET pending = 0 WHERE matrix_row IN ({placeholders})", chunk)
+                self._freed_rows = []
+
+    def save_new_person(self, embedding, name_label=None, image_path=None, bbox=None, confidence=None):
+        """Save a new person to the store."""
+        try:
+            vector = self._to_vector(embedding)
+            with self._transaction() as conn:
+                person_id = self.generatePersonID(conn)
+                conn.execute(
+                    "INSERT INTO persons (person_id, name_label, sum_row, embedding_count, face_count, version) "
+                    "VALUES (?, ?, ?, 1, 1, ?)",
+                    (person_id, name_label, self._store_vector(conn, vector), self._next_version(conn))
+                )
+                self._add_prototype(conn, person_id, vector)
+                self._insert_face(conn, person_id, vector, image_path, bbox, confidence)
+            print(f"Successfully saved new person with ID: {person_id}")
+            return person_id
+        except Exception as e:
+            print(f"Error saving new person: {e}")
+            raise
+
+    def add_embedding_to_person(self, person_id, embedding, image_path, bbox=None, confidence=None):
+        """Add a new embedding and image path, then update the representative embedding.
+
+        Stored prototypes follow the same cap and compaction strategies as the MongoDB
+        backend; the representative is the normalized running sum.
+        """
+        try:
+            vector = self._to_vector(embedding)
+            needs_compaction = False
+            with self._transaction() as conn:
+                person = conn.execute(
+                    "SELECT sum_row, embedding_count FROM persons WHERE person_id = ?", (person_id,)
+                ).fetchone()
+                if not person:
+                    raise ValueError(f"Person {person_id} not found")
+                sum_row, embedding_count = person
+                embedding_count += 1
+                embedding_sum = self.matrix.read([sum_row])[0] + vector
+                conn.execute(
+                    "UPDATE persons SET sum_row = ?, embedding_count = ?, face_count = face_count + 1, version = ? "
+                    "WHERE person_id = ?",
+                    (self._replace_vector(conn, sum_row, embedding_sum), embedding_count, self._next_version(conn), person_id)
+                )
+
+                stored_count = conn.execute("SELECT COUNT(*) FROM prototypes WHERE person_id = ?", (person_id,)).fetchone()[0]
+                if self.compaction_strategy == "centroid" and embedding_count > self.max_embeddings:
+                    # "centroid" keeps only the running sum once the count exceeds the cap
+                    if stored_count:
+                        rows = [row for (row,) in conn.execute(
+                            "SELECT matrix_row FROM prototypes WHERE person_id = ?", (person_id,)
+                        )]
+                        conn.execute("DELETE FROM prototypes WHERE person_id = ?", (person_id,))
+                        self._free_rows(conn, rows)
+                elif stored_count < self.max_embeddings:
+                    self._add_prototype(conn, person_id, vector)
+                elif self.compaction_strategy == "reservoir":
+                    # Reservoir sampling: every embedding seen so far has equal odds of being stored
+                    position = random.randrange(embedding_count)
+                    if position < self.max_embeddings:
+                        slot, matrix_row = conn.execute(
+                            "SELECT slot, matrix_row FROM prototypes WHERE person_id = ? ORDER BY slot LIMIT 1 OFFSET ?",
+                            (person_id, position)
+                        ).fetchone()
+                        conn.execute(
+                            "UPDATE prototypes SET matrix_row = ? WHERE person_id = ? AND slot = ?",
+                            (self._replace_vector(conn, matrix_row, vector), person_id, slot)
+                        )
+                elif self.compaction_strategy == "kmedoids":
+                    self._add_prototype(conn, person_id, vector)
+                    needs_compaction = True
+                self._insert_face(conn, person_id, vector, image_path, bbox, confidence)
+
+            if needs_compaction:
+                self.compact_person(person_id)
+            print(f"Successfully added embedding and updated representative for {person_id}")
+            return True
+        except Exception as e:
+            print(f"Error adding embedding to person: {e}")
+            raise
+
+    def getPerson(self, person_id):
+        """Retrieve a person by their ID."""
+        try:
+            with self._transaction(write=False) as conn:
+                person = conn.execute("SELECT name_label, sum_row FROM persons WHERE person_id = ?", (person_id,)).fetchone()
+                if not person:
+                    raise ValueError(f"Person {person_id} not found")
+                name_label, sum_row = person
+                prototype_rows = [row for (row,) in conn.execute(
+                    "SELECT matrix_row FROM prototypes WHERE person_id = ? ORDER BY slot", (person_id,)
+                )]
+                image_paths = self._get_image_paths(conn, [person_id]).get(person_id, [])
+                vectors = self.matrix.read([sum_row] + prototype_rows)
+            return self._person_record(name_label, vectors[0], vectors[1:], image_paths)
+        except Exception as e:
+            print(f"Error retrieving person: {e}")
+            raise
+
+    def update_person_name(self, person_id, new_name):
+        """Update the name label of a person."""
+        try:
+            with self._transaction() as conn:
+                updated = conn.execute(
+                    "UPDATE persons SET name_label = ? WHERE person_id = ?", (new_name, person_id)
+                ).rowcount
+            if updated > 0:
+                print(f"Successfully updated name for person {person_id}")
+                return True
+            print(f"No person found with ID {person_id}")
+            return False
+        except Exception as e:
+            print(f"Error updating person name: {e}")
+            raise
+
+    def merge_persons(self, target_id, source_ids):
+        """Merge multiple persons into one in a single transaction.
+
+        Running sums are added, prototypes and faces are reassigned to the target by ID,
+        and the sources are deleted and tombstoned.
+        """
+        try:
+            source_ids = self._merge_source_ids(target_id, source_ids)
+            placeholders = ", ".join("?" * len(source_ids))
+
+            with self._transaction() as conn:
+                target = conn.execute(
+                    "SELECT sum_row, embedding_count, face_count FROM persons WHERE person_id = ?", (target_id,)
+                ).fetchone()
+                if not target:
+                    raise ValueError(f"Target person {target_id} not found")
+                sources = conn.execute(
+                    f"SELECT sum_row, embedding_count, face_count FROM persons WHERE person_id IN ({placeholders})",
+                    source_ids
+                ).fetchall()
+                if len(sources) != len(source_ids):
+                    raise ValueError("Some source persons not found")
+
+                sum_rows = [target[0]] + [source[0] for source in sources]
+                embedding_sum = self.matrix.read(sum_rows).sum(axis=0)
+                new_sum_row = self._store_vector(conn, embedding_sum)
+                self._free_rows(conn, sum_rows)
+                version = self._next_version(conn)
+                conn.execute(
+                    "UPDATE persons SET sum_row = ?, embedding_count = ?, face_count = ?, version = ? WHERE person_id = ?",
+                    (new_sum_row, sum(row[1] for row in [target] + sources), sum(row[2] for row in [target] + sources),
+                     version, target_id)
+                )
+
+                # Source prototypes are appended after the target's own slots
+                next_slot = conn.execute(
+                    "SELECT COALESCE(MAX(slot) + 1, 0) FROM prototypes WHERE person_id = ?", (target_id,)
+                ).fetchone()[0]
+                moved = conn.execute(
+                    f"SELECT person_id, slot FROM prototypes WHERE person_id IN ({placeholders}) ORDER BY person_id, slot",
+                    source_ids
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE prototypes SET person_id = ?, slot = ? WHERE person_id = ? AND slot = ?",
+                    [(target_id, next_slot + i, person_id, slot) for i, (person_id, slot) in enumerate(moved)]
+                )
+                conn.execute(f"UPDATE faces SET person_id = ? WHERE person_id IN ({placeholders})", [target_id] + source_ids)
+                conn.execute(f"DELETE FROM persons WHERE person_id IN ({placeholders})", source_ids)
+                conn.executemany(
+                    "INSERT INTO person_tombstones (person_id, version) VALUES (?, ?)",
+                    [(source_id, version) for source_id in source_ids]
+                )
+                stored_count = conn.execute("SELECT COUNT(*) FROM prototypes WHERE person_id = ?", (target_id,)).fetchone()[0]
+
+            # Keep the merged person within the embedding cap
+            if self._over_cap(stored_count, sum(row[1] for row in [target] + sources)):
+                self.compact_person(target_id)
+            print(f"Successfully merged {len(source_ids)} into {target_id} in Database.")
+            return True
+        except Exception as e:
+            print(f"Error merging persons: {e}")
+            raise
+
+    def get_all_persons(self):
+        """Retrieve all persons from the store."""
+        try:
+            with self._transaction(write=False) as conn:
+                persons = conn.execute("SELECT person_id, name_label, sum_row FROM persons").fetchall()
+                prototypes = {}
+                for person_id, matrix_row in conn.execute("SELECT person_id, matrix_row FROM prototypes ORDER BY person_id, slot"):
+                    prototypes.setdefault(person_id, []).append(matrix_row)
+                image_paths = self._get_image_paths(conn)
+                sums = self.matrix.read([sum_row for _, _, sum_row in persons])
+                return {
+                    person_id: self._person_record(name_label, embedding_sum, self.matrix.read(prototypes.get(person_id, [])),
+                                                   image_paths.get(person_id, []))
+                    for (person_id, name_label, _), embedding_sum in zip(persons, sums)
+                }
+        except Exception as e:
+            print(f"Error retrieving persons: {e}")
+            raise
+
+    def get_person_labels(self, person_ids):
+        """Return {person_id: name_label} for the given IDs without loading any embeddings."""
+        try:
+            labels = {}
+            with self._transaction(write=False) as conn:
+                for chunk, placeholders in self._chunked(person_ids):
+                    for person_id, name_label in conn.execute(
+                        f"SELECT person_id, name_label FROM persons WHERE person_id IN ({placeholders})", chunk
+                    ):
+                        labels[person_id] = name_label
+            return labels
+        except Exception as e:
+            print(f"Error retrieving person labels: {e}")
+            raise
+
+    def count_persons(self, search=None):
+        """Count persons, optionally only those whose name or ID starts with search."""
+        try:
+            where, params = self._search_clause(search)
+            with self._transaction(write=False) as conn:
+                return conn.execute(f"SELECT COUNT(*) FROM persons {where}", params).fetchone()[0]
+        except Exception as e:
+            print(f"Error counting persons: {e}")
+            raise
+
+    def get_persons_page(self, page=0, page_size=50, search=None, after_person_id=None):
+        """Return one page of lightweight person rows ordered by person ID.
+
+        Rows hold person_id, name_label, image_count and preview_image_path. Pass
+        after_person_id (the last ID of the previous page) to seek on the primary key
+        instead of skipping rows.
+        """
+        try:
+            where, params = self._search_clause(search, after_person_id)
+            offset = page * page_size if after_person_id is None else 0
+            with self._transaction(write=False) as conn:
+                persons = conn.execute(
+                    f"SELECT person_id, name_label, face_count FROM persons {where} ORDER BY person_id LIMIT ? OFFSET ?",
+                    params + [page_size, offset]
+                ).fetchall()
+                return self._person_rows(conn, persons)
+        except Exception as e:
+            print(f"Error retrieving persons page: {e}")
+            raise
+
+    def get_person_rows(self, person_ids):
+        """Return lightweight rows (as in get_persons_page) for the given IDs, keyed by person ID."""
+        try:
+            rows = {}
+            with self._transaction(write=False) as conn:
+                for chunk, placeholders in self._chunked(person_ids):
+                    persons = conn.execute(
+                        f"SELECT person_id, name_label, face_count FROM persons WHERE person_id IN ({placeholders})", chunk
+                    ).fetchall()
+                    rows.update({row["person_id"]: row for row in self._person_rows(conn, persons)})
+            return rows
+        except Exception as e:
+            print(f"Error retrieving person rows: {e}")
+            raise
+
+    def get_total_image_count(self):
+        """Total number of face images managed across all persons."""
+        try:
+            with self._transaction(write=False) as conn:
+                return conn.execute("SELECT COALESCE(SUM(face_count), 0) FROM persons").fetchone()[0]
+        except Exception as e:
+            print(f"Error counting images: {e}")
+            raise
+
+    def get_representative_embedding(self, person_id):
+        """Retrieve a single person's representative embedding, or None if the person does not exist."""
+        try:
+            with self._transaction(write=False) as conn:
+                person = conn.execute("SELECT sum_row FROM persons WHERE person_id = ?", (person_id,)).fetchone()
+                if not person:
+                    return None
+                embedding_sum = self.matrix.read([person[0]])
+            return self._list_to_tensor(self._normalize(embedding_sum)[0])
+        except Exception as e:
+            print(f"Error retrieving representative embedding: {e}")
+            raise
+
+    def get_representative_changes(self, since_version=0):
+        """Return (changed, deleted, version) for snapshot refreshes.
+
+        Writes are serialized by SQLite, so no overlap window is needed. Matrix rows are
+        read under the same SQLite snapshot as the version: a person whose row is recycled
+        afterwards carries a newer version and is fetched again by the next refresh.
+        """
+        try:
+            with self._transaction(write=False) as conn:
+                version = self._get_meta(conn, "embedding_version")
+                persons = conn.execute(
+                    "SELECT person_id, sum_row FROM persons WHERE version > ?", (since_version,)
+                ).fetchall()
+                deleted = []
+                if since_version:
+                    deleted = [person_id for (person_id,) in conn.execute(
+                        "SELECT person_id FROM person_tombstones WHERE version > ?", (since_version,)
+                    )]
+                sums = self.matrix.read([sum_row for _, sum_row in persons])
+            changed = {person_id: vector for (person_id, _), vector in zip(persons, self._normalize(sums))}
+            return changed, deleted, version
+        except Exception as e:
+            print(f"Error retrieving representative changes: {e}")
+            raise
+
+    def get_store_id(self):
+        """Return the random ID of this store."""
+        with self._transaction(write=False) as conn:
+            return f"embedded:{self._get_meta(conn, 'store_id')}"
+
+    def get_faces_in_image(self, image_path):
+        """Return every face observation recorded for an image."""
+        try:
+            with self._transaction(write=False) as conn:
+                cursor = conn.execute(
+                    "SELECT face_id, person_id, bbox, confidence, model_version FROM faces WHERE image_path = ? ORDER BY face_id",
+                    (image_path,)
+                )
+                return [
+                    {"face_id": face_id, "person_id": person_id, "bbox": json.loads(bbox) if bbox else None,
+                     "confidence": confidence, "model_version": model_version}
+                    for face_id, person_id, bbox, confidence, model_version in cursor
+                ]
+        except Exception as e:
+            print(f"Error retrieving faces for image {image_path}: {e}")
+            raise
+
+    def remove_face(self, face_id):
+        """Remove one face observation and take its embedding out of the person's aggregates."""
+        try:
+            with self._transaction() as conn:
+                face = conn.execute("SELECT person_id, embedding FROM faces WHERE face_id = ?", (int(face_id),)).fetchone()
+                if not face:
+                    raise ValueError(f"Face {face_id} not found")
+                person_id, embedding = face
+                conn.execute("DELETE FROM faces WHERE face_id = ?", (int(face_id),))
+
+                person = conn.execute(
+                    "SELECT sum_row, embedding_count FROM persons WHERE person_id = ?", (person_id,)
+                ).fetchone()
+                if not person:
+                    return True
+                sum_row, embedding_count = person
+                prototypes = conn.execute(
+                    "SELECT slot, matrix_row FROM prototypes WHERE person_id = ?", (person_id,)
+                ).fetchall()
+
+                if not conn.execute("SELECT 1 FROM faces WHERE person_id = ? LIMIT 1", (person_id,)).fetchone():
+                    self._free_rows(conn, [sum_row] + [matrix_row for _, matrix_row in prototypes])
+                    conn.execute("DELETE FROM prototypes WHERE person_id = ?", (person_id,))
+                    conn.execute("DELETE FROM persons WHERE person_id = ?", (person_id,))
+                    conn.execute("INSERT INTO person_tombstones (person_id, version) VALUES (?, ?)",
+                                 (person_id, self._next_version(conn)))
+                    print(f"Removed face {face_id} and its now empty person {person_id}")
+                    return True
+
+                if embedding is None:
+                    conn.execute("UPDATE persons SET face_count = face_count - 1 WHERE person_id = ?", (person_id,))
+                    print(f"Face {face_id} has no stored embedding; representative of {person_id} left unchanged")
+                    print(f"Removed face {face_id} from person {person_id}")
+                    return True
+
+                vector = np.frombuffer(embedding, dtype=np.float32)
+                embedding_sum = self.matrix.read([sum_row])[0] - vector
+                conn.execute(
+                    "UPDATE persons SET sum_row = ?, embedding_count = ?, face_count = face_count - 1, version = ? "
+                    "WHERE person_id = ?",
+                    (self._replace_vector(conn, sum_row, embedding_sum), max(embedding_count - 1, 1),
+                     self._next_version(conn), person_id)
+                )
+                # Prototypes are float32 copies of the face embedding, so a kept one matches exactly
+                stored = self.matrix.read([matrix_row for _, matrix_row in prototypes])
+                dropped = [(slot, matrix_row) for (slot, matrix_row), prototype in zip(prototypes, stored)
+                           if np.array_equal(prototype, vector)]
+                conn.executemany("DELETE FROM prototypes WHERE person_id = ? AND slot = ?",
+                                 [(person_id, slot) for slot, _ in dropped])
+                self._free_rows(conn, [matrix_row for _, matrix_row in dropped])
+            print(f"Removed face {face_id} from person {person_id}")
+            return True
+        except Exception as e:
+            print(f"Error removing face {face_id}: {e}")
+            raise
+
+    def copy_faces_to_image(self, original_path, duplicate_path):
+        """Record a duplicate image as showing the same faces as its original.
+
+        The copies carry no embedding, so person embeddings and representatives are left
+        untouched; returns the person IDs found in the original.
+        """
+        try:
+            with self._transaction() as conn:
+                faces = conn.execute(
+                    "SELECT person_id, bbox, confidence FROM faces WHERE image_path = ? ORDER BY face_id", (original_path,)
+                ).fetchall()
+                per_person = {}
+                for person_id, bbox, confidence in faces:
+                    self._insert_face(conn, person_id, None, duplicate_path, json.loads(bbox) if bbox else None,
+                                      confidence, duplicate_of=original_path)
+                    per_person[person_id] = per_person.get(person_id, 0) + 1
+                conn.executemany(
+                    "UPDATE persons SET face_count = face_count + ? WHERE person_id = ?",
+                    [(count, person_id) for person_id, count in per_person.items()]
+                )
+            return list(per_person)
+        except Exception as e:
+            print(f"Error copying faces from {original_path} to {duplicate_path}: {e}")
+            raise
+
+    def compact_person(self, person_id, strategy=None):
+        """Shrink a person's stored prototypes to the cap; the representative is left unchanged."""
+        strategy = strategy or self.compaction_strategy
+        try:
+            with self._transaction() as conn:
+                person = conn.execute("SELECT embedding_count FROM persons WHERE person_id = ?", (person_id,)).fetchone()
+                if not person:
+                    raise ValueError(f"Person {person_id} not found")
+                prototypes = conn.execute(
+                    "SELECT slot, matrix_row FROM prototypes WHERE person_id = ? ORDER BY slot", (person_id,)
+                ).fetchall()
+                if not self._over_cap(len(prototypes), person[0], strategy):
+                    return False
+
+                if strategy == "reservoir":
+                    kept = random.sample(range(len(prototypes)), self.max_embeddings)
+                elif strategy == "kmedoids":
+                    embeddings = list(self.matrix.read([matrix_row for _, matrix_row in prototypes]))
+                    kept = self._kmedoid_indices(embeddings, max(1, self.max_embeddings // 2))
+                elif strategy == "centroid":
+                    kept = []
+                else:
+                    raise ValueError(f"Unknown compaction strategy '{strategy}'")
+
+                kept = set(kept)
+                dropped = [prototype for i, prototype in enumerate(prototypes) if i not in kept]
+                conn.executemany("DELETE FROM prototypes WHERE person_id = ? AND slot = ?",
+                                 [(person_id, slot) for slot, _ in dropped])
+                self._free_rows(conn, [matrix_row for _, matrix_row in dropped])
+            print(f"Compacted {person_id} from {len(prototypes)} to {len(kept)} stored embeddings")
+            return True
+        except Exception as e:
+            print(f"Error compacting person {person_id}: {e}")
+            raise
+
+    def compact_all_persons(self, strategy=None):
+        """Compact every person over the embedding cap."""
+        with self._transaction(write=False) as conn:
+            person_ids = [person_id for person_id, embedding_count, stored_count in conn.execute(
+                "SELECT person_id, embedding_count, COUNT(*) FROM prototypes JOIN persons USING (person_id) GROUP BY person_id"
+            ) if self._over_cap(stored_count, embedding_count, strategy)]
+        compacted = 0
+        for person_id in person_ids:
+            if self.compact_person(person_id, strategy):
+                compacted += 1
+        return compacted
+
+    def generatePersonID(self, conn=None):
+        """Generate a unique person ID using timestamp and random string."""
+        conn = conn or self.conn
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        person_id = f"P{timestamp}{secrets.token_hex(3)}"
+        while conn.execute("SELECT 1 FROM persons WHERE person_id = ?", (person_id,)).fetchone():
+            person_id = f"P{timestamp}{secrets.token_hex(3)}"
+        return person_id
+
+    def close(self):
+        """Flush the embedding matrix and close the SQLite connection."""
+        try:
+            with self._lock:
+                self.matrix.close()
+                self.conn.close()
+            print("Embedded store closed successfully")
+        except Exception as e:
+            print(f"Error closing embedded store: {e}")
+
+    # --- Internal helpers ---
+
+    def _person_rows(self, conn, persons):
+        """Build display rows from (person_id, name_label, face_count), with one preview image per person."""
+        previews = {}
+        person_ids = [person_id for person_id, _, _ in persons]
+        for chunk, placeholders in self._chunked(person_ids):
+            previews.update(conn.execute(
+                "SELECT person_id, image_path FROM faces WHERE face_id IN ("
+                f"SELECT MIN(face_id) FROM faces WHERE person_id IN ({placeholders}) AND image_path IS NOT NULL "
+                "GROUP BY person_id)", chunk
+            ).fetchall())
+        return [
+            {"person_id": person_id, "name_label": name_label, "image_count": face_count,
+             "preview_image_path": previews.get(person_id)}
+            for person_id, name_label, face_count in persons
+        ]
+
+    def _search_clause(self, search, after_person_id=None):
+        """Case-sensitive prefix match on name_label or person_id as index-friendly range conditions."""
+        conditions, params = [], []
+        if search:
+            # Every string starting with search sorts below search followed by the highest code point
+            upper = search + "\U0010ffff"
+            conditions.append("((name_label >= ? AND name_label < ?) OR (person_id >= ? AND person_id < ?))")
+            params += [search, upper, search, upper]
+        if after_person_id is not None:
+            conditions.append("person_id > ?")
+            params.append(after_person_id)
+        return ("WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+    def _get_image_paths(self, conn, person_ids=None):
+        """Group observed image paths by person, in insertion order."""
+        paths = {}
+        query = "SELECT person_id, image_path FROM faces WHERE image_path IS NOT NULL"
+        if person_ids is None:
+            chunks = [([], None)]
+        else:
+            chunks = self._chunked(person_ids)
+        for chunk, placeholders in chunks:
+            sql = query + (f" AND person_id IN ({placeholders})" if placeholders else "") + " ORDER BY face_id"
+            for person_id, image_path in conn.execute(sql, chunk):
+                paths.setdefault(person_id, []).append(image_path)
+        return paths
+
+    def _insert_face(self, conn, person_id, vector, image_path, bbox, confidence, duplicate_of=None):
+        """Record a single face observation with a compact float32 embedding."""
+        conn.execute(
+            "INSERT INTO faces (person_id, image_path, bbox, embedding, confidence, model_version, duplicate_of, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                person_id,
+                image_path,
+                json.dumps([int(v) for v in bbox]) if bbox is not None else None,
+                vector.astype(np.float32).tobytes() if vector is not None else None,
+                float(confidence) if confidence is not None else None,
+                MODEL_VERSION,
+                duplicate_of,
+                datetime.now().isoformat()
+            )
+        )
+
+    def _person_record(self, name_label, embedding_sum, prototypes, image_paths):
+        """Build the person dictionary returned by getPerson and get_all_persons."""
+        return {
+            "name_label": name_label,
+            "embeddings": [self._list_to_tensor(prototype) for prototype in prototypes],
+            "representative_embedding": self._list_to_tensor(self._normalize(embedding_sum[None, :])[0]),
+            "representative_image_paths": image_paths
+        }
+
+    def _add_prototype(self, conn, person_id, vector):
+        """Store a prototype in the next free slot of a person."""
+        conn.execute(
+            "INSERT INTO prototypes (person_id, slot, matrix_row) "
+            "SELECT ?, COALESCE(MAX(slot) + 1, 0), ? FROM prototypes WHERE person_id = ?",
+            (person_id, self._store_vector(conn, vector), person_id)
+        )
+
+    def _store_vector(self, conn, vector):
+        """Write a vector to a free matrix row and return the row."""
+        if self.matrix.dim is None:
+            self._open_matrix(conn, len(vector))
+        free = conn.execute("SELECT matrix_row FROM free_rows WHERE pending = 0 LIMIT 1").fetchone()
+        if free:
+            row = free[0]
+            conn.execute("DELETE FROM free_rows WHERE matrix_row = ?", (row,))
+        else:
+            row = self._increment_meta(conn, "row_count") - 1
+        self.matrix.write(row, vector)
+        return row
+
+    def _replace_vector(self, conn, old_row, vector):
+        """Copy-on-write update of a matrix row; returns the new row."""
+        row = self._store_vector(conn, vector)
+        self._free_rows(conn, [old_row])
+        return row
+
+    def _free_rows(self, conn, rows):
+        """Return matrix rows to the free list, held back from reuse until this transaction commits."""
+        rows = [int(row) for row in rows]
+        conn.executemany("INSERT OR IGNORE INTO free_rows (matrix_row, pending) VALUES (?, 1)", [(row,) for row in rows])
+        self._freed_rows.extend(rows)
+
+    def _open_matrix(self, conn, dim=None):
+        """Map the embedding matrix once its dimension is known, recording it on first use."""
+        stored_dim = self._get_meta(conn, "embedding_dim")
+        if not stored_dim and dim:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('embedding_dim', ?)", (dim,))
+            stored_dim = dim
+        if stored_dim:
+            self.matrix.open(stored_dim)
+
+    def _next_version(self, conn):
+        """Advance the change counter used by embedding snapshots."""
+        return self._increment_meta(conn, "embedding_version")
+
+    def _increment_meta(self, conn, key):
+        """Increment a meta counter and return its new value."""
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, 1) ON CONFLICT(key) DO UPDATE SET value = value + 1", (key,)
+        )
+        return self._get_meta(conn, key)
+
+    def _get_meta(self, conn, key):
+        """Read a meta counter, 0 when unset."""
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _chunked(self, ids):
+        """Split IDs into (chunk, placeholders) pairs for IN clauses."""
+        ids = list(ids)
+        return [
+            (ids[start:start + IN_CHUNK_SIZE], ", ".join("?" * len(ids[start:start + IN_CHUNK_SIZE])))
+            for start in range(0, len(ids), IN_CHUNK_SIZE)
+        ]
+
+    def _to_vector(self, embedding):
+        """Flatten a tensor, array or list embedding into a float32 vector."""
+        if hasattr(embedding, "detach"):
+            embedding = embedding.detach().cpu().numpy()
+        return np.asarray(embedding, dtype=np.float32).reshape(-1)
+
+    def _normalize(self, vectors):
+        """L2-normalize rows; normalizing a running sum equals normalizing the mean."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1)
@@ -0,0 +1,243 @@
+# Memory-mapped on-disk snapshot of representative embeddings shared between processes
+import os
+import json
+import secrets
+import time
+import numpy as np
+from config import SNAPSHOT_PERSIST_SECONDS
+
+INDEX_FILENAME = "index.json"
+
+def write_snapshot(snapshot_dir, person_ids, matrix, version, store_id=None):
+    """Write a raw float32 matrix plus its ID table, publishing the index atomically.
+
+    Data files are never rewritten in place, so readers that still map an older file
+    keep a consistent view until they reload. store_id names the store the versions
+    belong to.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+
+    # Unique per write: local changes can be persisted again at the same version
+    data_file = f"embeddings.{version}.{os.getpid()}.{secrets.token_hex(4)}.f32"
+    data_path = os.path.join(snapshot_dir, data_file)
+    matrix.tofile(data_path + ".tmp")
+    os.replace(data_path + ".tmp", data_path)
+
+    index = {
+        "store_id": store_id,
+        "version": version,
+        "count": int(matrix.shape[0]),
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "data_file": data_file,
+        "person_ids": list(person_ids),
+        "written_at": time.time()
+    }
+    index_path = os.path.join(snapshot_dir, INDEX_FILENAME)
+    tmp_index_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_index_path, index_path)
+    return data_file
+
+class EmbeddingSnapshot:
+    def __init__(self, snapshot_dir, persist_seconds=SNAPSHOT_PERSIST_SECONDS):
+        """Representative embeddings as a read-only memory map plus a small in-memory overlay.
+
+        The memory-mapped base is shared by every process through the page cache. Changes
+        since the base was written (from the database or from this process's own writes)
+        live in the overlay until the next persist folds them into a new base file.
+        """
+        self.snapshot_dir = snapshot_dir
+        self.persist_seconds = persist_seconds
+        self.person_ids = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.version = 0
+        self.store_id = None  # store the base and version belong to, once known
+        self._data_file = None
+        self._row = {}
+        self._overlay = {}    # person_id -> unit-length float32 embedding newer than the base
+        self._removed = set() # person IDs deleted since the base was written
+        self._persisted_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._active_ids())
+
+    def load(self):
+        """Map the published snapshot if it is newer than the current view; returns True if one was loaded.
+
+        Snapshots of another store are ignored once this view knows its store.
+        """
+        # Another process may publish a new index and delete the data file in between; read again once
+        for attempt in range(2):
+            index = self._read_index()
+            if index is None:
+                return False
+            if self.store_id is not None and index.get("store_id") != self.store_id:
+                return False
+            if self._data_file is not None and index["version"] <= self.version:
+                return False
+            try:
+                self._set_base(index["person_ids"], index["data_file"], index["dim"], index["version"])
+            except FileNotFoundError:
+                continue
+            self.store_id = index.get("store_id")
+            return True
+        return False
+
+    def refresh(self, db_manager, persist=None):
+        """Catch up with the database, fetching only persons changed since the current version.
+
+        A snapshot of another store, or one ahead of the store's change counter (e.g. a
+        dropped database), is discarded and rebuilt from scratch.
+
+        persist=None writes a new base file when none exists yet, when the overlay has grown
+        large, or when persist_seconds have passed; True or False force the choice.
+        """
+        store_id = db_manager.get_store_id()
+        if store_id != self.store_id:
+            self._reset(store_id)
+        self.load()
+        changed, deleted, version = db_manager.get_representative_changes(self.version)
+        if version < self.version:
+            self._reset(store_id)
+            changed, deleted, version = db_manager.get_representative_changes(0)
+        updated = False
+        for person_id, embedding in changed.items():
+            # The database may resend recent rows; only real changes enter the overlay
+            if not self._is_current(person_id, embedding):
+                self.update_local(person_id, embedding)
+                updated = True
+        for person_id in deleted:
+            if person_id in self._overlay or (person_id in self._row and person_id not in self._removed):
+                self.remove_local(person_id)
+                updated = True
+        self.version = max(self.version, version)
+
+        if persist is None:
+            pending = len(self._overlay) + len(self._removed)
+            persist = pending > 0 and (
+                self._data_file is None
+                or pending > max(1000, len(self.person_ids) // 10)
+                or time.monotonic() - self._persisted_at >= self.persist_seconds
+            )
+        if persist:
+            self.persist()
+        return updated
+
+    def persist(self):
+        """Fold the overlay into a new base file and map it."""
+        person_ids = self._active_ids()
+        rows = [self._embedding_for(person_id) for person_id in person_ids]
+        dim = rows[0].shape[0] if rows else (self.matrix.shape[1] if self.matrix.ndim == 2 else 0)
+        matrix = np.stack(rows) if rows else np.zeros((0, dim), dtype=np.float32)
+
+        previous = self._data_file
+        data_file = write_snapshot(self.snapshot_dir, person_ids, matrix, self.version, self.store_id)
+        self._set_base(person_ids, data_file, dim, self.version)
+        if previous and previous != self._data_file:
+            try:
+                os.remove(os.path.join(self.snapshot_dir, previous))
+            except OSError:
+                pass  # still mapped elsewhere on platforms that forbid deleting open files
+
+    def update_local(self, person_id, embedding):
+        """Record a person's new representative embedding without touching the base file."""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        self._overlay[person_id] = vector / norm if norm > 0 else vector
+        self._removed.discard(person_id)
+
+    def remove_local(self, person_id):
+        """Record that a person no longer exists."""
+        self._overlay.pop(person_id, None)
+        if person_id in self._row:
+            self._removed.add(person_id)
+
+    def match(self, embeddings, similarity_threshold):
+        """Return a (person_id or None, similarity) tuple for each query embedding."""
+        queries = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1)
+
+        best_ids = [None] * len(queries)
+        best_similarities = np.full(len(queries), -1.0, dtype=np.float32)
+
+        if len(self.person_ids):
+            similarities = queries @ self.matrix.T
+            hidden = [self._row[pid] for pid in self._removed.union(self._overlay) if pid in self._row]
+            if hidden:
+                similarities[:, hidden] = -np.inf
+            rows = similarities.argmax(axis=1)
+            for i, row in enumerate(rows):
+                if similarities[i, row] > best_similarities[i]:
+                    best_similarities[i] = similarities[i, row]
+                    best_ids[i] = self.person_ids[row]
+
+        if self._overlay:
+            overlay_ids = list(self._overlay.keys())
+            similarities = queries @ np.stack([self._overlay[pid] for pid in overlay_ids]).T
+            rows = similarities.argmax(axis=1)
+            for i, row in enumerate(rows):
+                if similarities[i, row] > best_similarities[i]:
+                    best_similarities[i] = similarities[i, row]
+                    best_ids[i] = overlay_ids[row]
+
+        return [
+            (person_id if similarity >= similarity_threshold else None, float(similarity))
+            for person_id, similarity in zip(best_ids, best_similarities)
+        ]
+
+    def _read_index(self):
+        """Return the published index, or None when there is none yet."""
+        try:
+            with open(os.path.join(self.snapshot_dir, INDEX_FILENAME), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _reset(self, store_id):
+        """Drop the current view and start over for store_id."""
+        self._set_base([], None, 0, 0)
+        self.store_id = store_id
+
+    def _set_base(self, person_ids, data_file, dim, version):
+        """Map a base data file read-only and reset the overlay it supersedes."""
+        if person_ids:
+            self.matrix = np.memmap(os.path.join(self.snapshot_dir, data_file), dtype=np.float32,
+                                    mode="r", shape=(len(person_ids), dim))
+        else:
+            self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.person_ids = list(person_ids)
+        self.version = version
+        self._data_file = data_file
+        self._row = {person_id: row for row, person_id in enumerate(self.person_ids)}
+        # Later changes come back through refresh() or update_local()
+        self._overlay.clear()
+        self._removed.clear()
+        self._persisted_at = time.monotonic()
+
+    def _is_current(self, person_id, embedding):
+        """True when the snapshot already holds this embedding for the person."""
+        if person_id in self._removed:
+            return False
+        if person_id in self._overlay:
+            current = self._overlay[person_id]
+        elif person_id in self._row:
+            current = self.matrix[self._row[person_id]]
+        else:
+            return False
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return current.shape == vector.shape and np.allclose(current, vector / norm if norm > 0 else vector, atol=1e-6)
+
+    def _active_ids(self):
+        """Person IDs visible through the base plus overlay."""
+        base_ids = [pid for pid in self.person_ids if pid not in self._removed and pid not in self._overlay]
+        return base_ids + list(self._overlay.keys())
+
+    def _embedding_for(self, person_id):
+        """Current embedding of a person, preferring the overlay."""
+        if person_id in self._overlay:
+            return self._overlay[person_id]
+        return np.asarray(self.matrix[self._row[person_id]], dtype=np.float32)
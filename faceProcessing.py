@@ -5,13 +5,20 @@ import numpy as np
 from PIL import Image
 import torchvision.transforms as transforms
 import uuid
+import time
 from aiModels import YOLO_MODEL, FACENET_MODEL, DEVICE
-from databaseManager import MongoDBManager
-from config import CONNECTION_URI, DATABASE_NAME, SIMILARITY_THRESHOLD, CONFIDENCE_THRESHOLD
+from storageBackend import create_storage_backend
+from embeddingSnapshot import EmbeddingSnapshot
+from config import SIMILARITY_THRESHOLD, CONFIDENCE_THRESHOLD, SNAPSHOT_DIR, SNAPSHOT_REFRESH_SECONDS
 from folderSync import rename_folder_on_disk, merge_person_folders
 
-# Initialize database connection
-db_manager = MongoDBManager(connection_uri=CONNECTION_URI, database_name=DATABASE_NAME)
+# Initialize the storage backend selected in config.py
+db_manager = create_storage_backend()
+
+# Representative embeddings shared with other processes through a memory-mapped snapshot
+representative_snapshot = EmbeddingSnapshot(SNAPSHOT_DIR)
+representative_snapshot.load()
+_snapshot_refreshed_at = None
 
 def standardize_image(img):
     """Standardize image for FaceNet input by converting to RGB and applying transforms."""
@@ -37,8 +44,36 @@ def standardize_image(img):
     img_tensor = transform(img)
     return img_tensor
 
-def detect_faces_yolo(image_path):
-    """Detect faces in an image using YOLO with padding for better face capture."""
+def _padded_boxes(result, width, height, with_confidence=False):
+    """Convert one YOLO result into padded boxes clipped to the image bounds."""
+    bboxes = []
+    for box in result.boxes:
+        x1, y1, x2, y2 = map(int, box.xyxy[0])
+        
+        # Add padding (20% of box size) for better face capture
+        box_width = x2 - x1
+        box_height = y2 - y1
+        padding_x = int(box_width * 0.2)
+        padding_y = int(box_height * 0.2)
+        
+        # Apply padding while ensuring we don't go out of image bounds
+        x1 = max(0, x1 - padding_x)
+        y1 = max(0, y1 - padding_y)
+        x2 = min(width, x2 + padding_x)
+        y2 = min(height, y2 + padding_y)
+        
+        if with_confidence:
+            bboxes.append(([x1, y1, x2, y2], float(box.conf[0])))
+        else:
+            bboxes.append([x1, y1, x2, y2])
+    return bboxes
+
+def detect_faces_yolo(image_path, with_confidence=False):
+    """Detect faces in an image using YOLO with padding for better face capture.
+
+    Returns a list of [x1, y1, x2, y2] boxes, or (box, confidence) tuples when
+    with_confidence is True.
+    """
     try:
         # Read image with PIL first to ensure RGB format
         img_pil = Image.open(image_path).convert('RGB')
@@ -52,27 +87,25 @@ def detect_faces_yolo(image_path):
 
         bboxes = []
         for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                
-                # Add padding (20% of box size) for better face capture
-                box_width = x2 - x1
-                box_height = y2 - y1
-                padding_x = int(box_width * 0.2)
-                padding_y = int(box_height * 0.2)
-                
-                # Apply padding while ensuring we don't go out of image bounds
-                x1 = max(0, x1 - padding_x)
-                y1 = max(0, y1 - padding_y)
-                x2 = min(width, x2 + padding_x)
-                y2 = min(height, y2 + padding_y)
-                
-                bboxes.append([x1, y1, x2, y2])
+            bboxes.extend(_padded_boxes(r, width, height, with_confidence))
         return bboxes
     except Exception as e:
         print(f"Error during YOLO face detection on {image_path}: {e}")
         return []
+
+def detect_faces_yolo_batch(images, with_confidence=False):
+    """Detect faces in several RGB images with a single YOLO call; returns one box list per image."""
+    if not images:
+        return []
+    try:
+        results = YOLO_MODEL(list(images), device=DEVICE, conf=CONFIDENCE_THRESHOLD, save=False, verbose=False)
+        return [
+            _padded_boxes(r, img.shape[1], img.shape[0], with_confidence)
+            for r, img in zip(results, images)
+        ]
+    except Exception as e:
+        print(f"Error during batched YOLO face detection: {e}")
+        return [[] for _ in images]
     
 def get_face_embedding(face_image):
     """Generate face embedding using FaceNet model."""
@@ -88,38 +121,59 @@ def get_face_embedding(face_image):
         print(f"Error getting face embedding: {e}")
         return None
 
-def identify_person(embedding1, similarity_threshold=SIMILARITY_THRESHOLD, image_path=None):
+def get_face_embeddings_batch(face_images):
+    """Generate FaceNet embeddings for several face crops in one forward pass; returns an (N, 512) tensor."""
+    if not face_images:
+        return None
+    try:
+        face_tensors = torch.stack([standardize_image(face) for face in face_images]).to(DEVICE)
+        with torch.no_grad():
+            return FACENET_MODEL(face_tensors)
+    except Exception as e:
+        print(f"Error getting batched face embeddings: {e}")
+        return None
+
+def get_representative_snapshot():
+    """Return the shared representative snapshot, catching up with the database when stale.
+
+    Writes made through this module are applied to the snapshot immediately; writes by
+    other processes become visible within SNAPSHOT_REFRESH_SECONDS.
+    """
+    global _snapshot_refreshed_at
+    now = time.monotonic()
+    if _snapshot_refreshed_at is None or now - _snapshot_refreshed_at >= SNAPSHOT_REFRESH_SECONDS:
+        representative_snapshot.refresh(db_manager)
+        _snapshot_refreshed_at = now
+    return representative_snapshot
+
+def _sync_snapshot(person_id):
+    """Apply a person's current representative embedding to the local snapshot."""
+    embedding = db_manager.get_representative_embedding(person_id)
+    if embedding is None:
+        representative_snapshot.remove_local(person_id)
+    else:
+        representative_snapshot.update_local(person_id, embedding.cpu().numpy())
+
+def identify_person(embedding1, similarity_threshold=SIMILARITY_THRESHOLD, image_path=None, bbox=None, confidence=None):
     """Identify a person based on face embedding similarity or create new person if no match."""
     try:
-        # Get all persons from database
-        persons = db_manager.get_all_persons()
-        
-        best_match = None
-        best_similarity = -1
-        
-        # Find best matching person based on cosine similarity
-        for person_id, person_data in persons.items():
-            embedding2 = person_data["representative_embedding"]
-            similarity = torch.nn.functional.cosine_similarity(
-                embedding1.unsqueeze(0),
-                embedding2.unsqueeze(0)
-            ).item()
-            
-            if similarity > best_similarity:
-                best_similarity = similarity
-                best_match = person_id
+        # Find best matching person based on cosine similarity against the shared snapshot
+        snapshot = get_representative_snapshot()
+        (best_match, best_similarity), = snapshot.match(embedding1.detach().cpu().numpy(), -1)
 
         # Return existing person if similarity exceeds threshold
-        if best_similarity >= similarity_threshold:
+        if best_match is not None and best_similarity >= similarity_threshold:
             if image_path:
-                db_manager.add_embedding_to_person(best_match, embedding1, image_path)
+                db_manager.add_embedding_to_person(best_match, embedding1, image_path, bbox=bbox, confidence=confidence)
+                _sync_snapshot(best_match)
             return best_match
         else:
             # Create new person if no match found
             if image_path:
-                id = db_manager.save_new_person(embedding1, name_label=None, image_path=image_path)
+                id = db_manager.save_new_person(embedding1, name_label=None, image_path=image_path, bbox=bbox, confidence=confidence)
             else:
                 id = db_manager.save_new_person(embedding1, name_label=None)
+            snapshot.update_local(id, embedding1.detach().cpu().numpy())
             return id
         
     except Exception as e:
@@ -129,8 +183,8 @@ def identify_person(embedding1, similarity_threshold=SIMILARITY_THRESHOLD, image
 def get_person_name(person_id):
     """Retrieve name label for a person from database."""
     try:
-        person = db_manager.getPerson(person_id)
-        return person["name_label"]
+        # Only the label is needed; getPerson would load every prototype and image path
+        return db_manager.get_person_labels([person_id]).get(person_id)
     
     except Exception as e:
         print(f"Error getting person name: {e}")
@@ -169,26 +223,37 @@ def update_person_name(person_id, new_name, output_dir):
 def merge_persons(target_id, source_ids, output_dir):
     """Merge multiple persons into one target person and combine their folders."""
     try:
-        # Verify target person exists
-        target_person_data = db_manager.getPerson(target_id)
-        if not target_person_data:
+        source_ids = list(source_ids)
+        if target_id in source_ids or len(set(source_ids)) != len(source_ids):
+            print("Source persons must be distinct and must not include the target.")
+            return False
+        # Verify target and source persons exist with a single lightweight lookup
+        person_labels = db_manager.get_person_labels([target_id] + list(source_ids))
+        if target_id not in person_labels:
             print(f"Target person with ID '{target_id}' not found in DB.")
             return False
 
-        # Verify all source persons exist
+        existing_sources = []
         for source in source_ids:
-            source_person_data = db_manager.getPerson(source)
-            if not source_person_data:
+            if source not in person_labels:
                 print(f"Source person with ID '{source}' not found in DB. Skipping.")
                 continue
+            existing_sources.append(source)
+        source_ids = existing_sources
+        if not source_ids:
+            print("No source persons left to merge.")
+            return False
 
         # Merge folders on disk first
-        db_merge_success = merge_person_folders(target_id, source_ids, output_dir) 
+        db_merge_success = merge_person_folders(target_id, source_ids, output_dir, person_labels) 
         print("Successfully merged persons in folders")
 
         if db_merge_success:
             # Then merge in database
             folder_merge_success = db_manager.merge_persons(target_id, source_ids)
+            for source in source_ids:
+                representative_snapshot.remove_local(source)
+            _sync_snapshot(target_id)
             
             if folder_merge_success:
                 print(f"Successfully merged persons and their folders.")
@@ -203,6 +268,26 @@ def merge_persons(target_id, source_ids, output_dir):
         print(f"Error merging persons and folders: {e}")
         return False
 
+def link_duplicate_faces(original_path, duplicate_path):
+    """Record a duplicate image as showing the same persons as its original."""
+    try:
+        return db_manager.copy_faces_to_image(original_path, duplicate_path)
+    except Exception as e:
+        print(f"Error linking duplicate {duplicate_path}: {e}")
+        return []
+
+def forget_image(image_path):
+    """Remove every face recorded for an image so it can be processed again."""
+    try:
+        affected = {face["person_id"] for face in db_manager.get_faces_in_image(image_path)}
+        removed = db_manager.remove_faces_for_image(image_path)
+        for person_id in affected:
+            _sync_snapshot(person_id)
+        return removed
+    except Exception as e:
+        print(f"Error forgetting faces of {image_path}: {e}")
+        return 0
+
 def close_database():
     """Close database connection."""
     try:
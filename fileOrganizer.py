@@ -1,8 +1,19 @@
 import os
+import json
+import time
 import shutil
+import argparse
 import cv2
-from faceProcessing import detect_faces_yolo, get_face_embedding, identify_person, get_person_name, update_person_name, merge_persons, close_database
-from config import SIMILARITY_THRESHOLD
+from faceProcessing import detect_faces_yolo, get_face_embedding, identify_person, get_person_name, update_person_name, merge_persons, forget_image, link_duplicate_faces, close_database
+from imageDedup import DedupIndex
+from videoProcessing import process_video
+from config import (SIMILARITY_THRESHOLD, WATCH_POLL_INTERVAL, WATCH_DEBOUNCE_SECONDS, WATCH_BATCH_SIZE,
+                    DEDUP_ENABLED, DEDUP_MAX_DISTANCE, DEDUP_POLICY, VIDEO_EXTENSIONS)
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
 
 def checkFolders(input_dir: str, output_dir: str):
     if not os.path.isdir(input_dir):
@@ -36,9 +47,11 @@ def copy_file_to_destination(source_path: str, dest_dir: str, filename: str) ->
         print(f"Error copying file {filename}: {e}")
         return False
 
-def Facedimensions(detected_faces_bboxes, original_image, filename, image_path: str, identified_person_ids: set):
+def Facedimensions(detected_faces_bboxes, original_image, filename, image_path: str, identified_person_ids: set, confidences=None):
     unknown_faces = 0
-    for bbox in detected_faces_bboxes:
+    if confidences is None:
+        confidences = [None] * len(detected_faces_bboxes)
+    for bbox, confidence in zip(detected_faces_bboxes, confidences):
         x1, y1, x2, y2 = bbox
         x1, y1 = max(0, x1), max(0, y1)
         x2, y2 = min(original_image.shape[1], x2), min(original_image.shape[0], y2)
@@ -52,57 +65,159 @@ def Facedimensions(detected_faces_bboxes, original_image, filename, image_path:
         embedding = get_face_embedding(face_crop_rgb_np)
 
         if embedding is not None:
-            person_id = identify_person(embedding, SIMILARITY_THRESHOLD, image_path)
+            person_id = identify_person(embedding, SIMILARITY_THRESHOLD, image_path, bbox=[x1, y1, x2, y2], confidence=confidence)
             if person_id:
                 identified_person_ids.add(person_id)
             else:
                 unknown_faces += 1
     return unknown_faces
 
-def process_images(input_dir: str, output_dir: str, similarity_threshold=SIMILARITY_THRESHOLD):
-    checkFolders(input_dir, output_dir)
+SUPPORTED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.heic')
+MEDIA_EXTENSIONS = SUPPORTED_EXTENSIONS + VIDEO_EXTENSIONS
+CHECKPOINT_FILENAME = ".processing_checkpoint.jsonl"
+WATCH_STATE_FILENAME = ".watch_state.json"
 
-    supported_extensions = ('.jpg', '.jpeg', '.png', '.heic')
-    processing_stats = {
+def new_processing_stats():
+    """Return an empty processing stats dictionary."""
+    return {
         "total_files": 0,
         "processed_files": 0,
         "no_faces": 0,
         "Num_of_people": 0,
         "multiple_people": 0,
+        "exact_duplicates": 0,
+        "near_duplicates": 0,
+        "videos": 0,
+        "video_tracks": 0,
         "errors": 0
     }
 
-    for filename in os.listdir(input_dir):
-        if not filename.lower().endswith(supported_extensions):
-            print(f"Skipping non-supported file: {filename}")
-            continue
+def new_dedup_index():
+    """Return a fresh duplicate index, or None when deduplication is disabled."""
+    return DedupIndex(max_distance=DEDUP_MAX_DISTANCE) if DEDUP_ENABLED else None
+
+def process_media_file(path: str, output_dir: str, processing_stats: dict, dedup_index=None):
+    """Route a file to video or image processing by its extension."""
+    if path.lower().endswith(VIDEO_EXTENSIONS):
+        process_video_file(path, processing_stats)
+    else:
+        process_image_file(path, output_dir, processing_stats, dedup_index)
+
+def process_video_file(video_path: str, processing_stats: dict, similarity_threshold=SIMILARITY_THRESHOLD):
+    """Identify the persons in a video, recording the video path for each of them.
+
+    Videos are not copied into person folders; they are linked to persons in the database only.
+    """
+    processing_stats["total_files"] += 1
+    print(f"Processing video {video_path}...")
+    try:
+        result = process_video(video_path, similarity_threshold)
+    except Exception as e:
+        print(f"Error processing video {os.path.basename(video_path)}: {e}")
+        processing_stats["errors"] += 1
+        return None
+    processing_stats["videos"] += 1
+    processing_stats["video_tracks"] += result["tracks"]
+    return result
 
-        processing_stats["total_files"] += 1
-        image_path = os.path.join(input_dir, filename)
-        print(f"Processing {image_path}...")
+def process_image_file(image_path: str, output_dir: str, processing_stats: dict, dedup_index=None):
+    """Detect, identify and organize a single image, updating processing_stats in place.
 
+    With a dedup_index, exact and near duplicates of an already organized image skip
+    inference and reuse the original's assignments according to DEDUP_POLICY.
+    """
+    if dedup_index is not None:
         try:
-            original_image = cv2.imread(image_path)
-            if original_image is None:
-                print(f"Warning: Could not read image {image_path}. Skipping.")
-                processing_stats["errors"] += 1
-                continue
-            
-            detected_faces_bboxes = detect_faces_yolo(image_path)
-
-            if not detected_faces_bboxes:
-                print(f"No faces detected in {filename}. Moving to '_no_faces'.")
-                no_faces_dir = os.path.join(output_dir, "_no_faces")
-                if copy_file_to_destination(image_path, no_faces_dir, filename):
-                    processing_stats["no_faces"] += 1
-                continue
-            
-            identified_person_ids = set()
-            unknown_faces = Facedimensions(detected_faces_bboxes, original_image, filename, image_path, identified_person_ids)
+            kind, original_path, hashes = dedup_index.find_duplicate(image_path)
+        except Exception as e:
+            print(f"Could not check {image_path} for duplicates: {e}")
+            kind, original_path, hashes = None, None, None
+
+        if kind is not None:
+            handle_duplicate(image_path, original_path, kind, output_dir, processing_stats, dedup_index)
+            return
+
+        destinations = _organize_image(image_path, output_dir, processing_stats)
+        if destinations is not None and hashes is not None:
+            dedup_index.add(image_path, hashes, destinations)
+        return
+
+    _organize_image(image_path, output_dir, processing_stats)
+
+def handle_duplicate(image_path: str, original_path: str, kind: str, output_dir: str, processing_stats: dict, dedup_index):
+    """Organize a duplicate like its original without running face inference."""
+    filename = os.path.basename(image_path)
+    processing_stats["total_files"] += 1
+    processing_stats["exact_duplicates" if kind == "exact" else "near_duplicates"] += 1
+    print(f"{filename} is an {kind} duplicate of {original_path}; reusing its face assignments.")
 
-            # Handle the results based on identified and unknown faces
-            if not identified_person_ids and unknown_faces > 0:
-                # All faces are unknown - create new person(s)
+    if DEDUP_POLICY == "skip":
+        return
+    if DEDUP_POLICY == "separate":
+        copy_file_to_destination(image_path, os.path.join(output_dir, "_duplicates"), filename)
+        return
+
+    link_duplicate_faces(original_path, image_path)
+    for dest_dir in dedup_index.get_assignments(original_path) or []:
+        if copy_file_to_destination(image_path, dest_dir, filename):
+            processing_stats["no_faces" if os.path.basename(dest_dir) == "_no_faces" else "processed_files"] += 1
+
+def _organize_image(image_path: str, output_dir: str, processing_stats: dict):
+    """Run face inference on one image and copy it into its folders.
+
+    Returns the destination directories, or None when the image could not be processed.
+    """
+    filename = os.path.basename(image_path)
+    processing_stats["total_files"] += 1
+    print(f"Processing {image_path}...")
+    destinations = []
+
+    try:
+        original_image = cv2.imread(image_path)
+        if original_image is None:
+            print(f"Warning: Could not read image {image_path}. Skipping.")
+            processing_stats["errors"] += 1
+            return None
+        
+        detections = detect_faces_yolo(image_path, with_confidence=True)
+        detected_faces_bboxes = [bbox for bbox, _ in detections]
+        confidences = [confidence for _, confidence in detections]
+
+        if not detected_faces_bboxes:
+            print(f"No faces detected in {filename}. Moving to '_no_faces'.")
+            no_faces_dir = os.path.join(output_dir, "_no_faces")
+            if copy_file_to_destination(image_path, no_faces_dir, filename):
+                processing_stats["no_faces"] += 1
+                destinations.append(no_faces_dir)
+            return destinations
+        
+        identified_person_ids = set()
+        unknown_faces = Facedimensions(detected_faces_bboxes, original_image, filename, image_path, identified_person_ids, confidences)
+
+        # Handle the results based on identified and unknown faces
+        if not identified_person_ids and unknown_faces > 0:
+            # All faces are unknown - create new person(s)
+            for i in range(unknown_faces):
+                person_name = f"Person_{processing_stats['Num_of_people'] + 1}"
+                processing_stats["Num_of_people"] += 1
+                person_dir = os.path.join(output_dir, person_name)
+                if copy_file_to_destination(image_path, person_dir, filename):
+                    print(f"Created new person {person_name} and moved {filename} there")
+                    processing_stats["processed_files"] += 1
+                    destinations.append(person_dir)
+
+        elif identified_person_ids:
+            # Copy to all identified person folders
+            for person_id in identified_person_ids:
+                person_name = get_person_name(person_id)
+                person_dir = os.path.join(output_dir, person_name if person_name else person_id)
+                if copy_file_to_destination(image_path, person_dir, filename):
+                    print(f"Moved {filename} to {person_dir}")
+                    processing_stats["processed_files"] += 1
+                    destinations.append(person_dir)
+
+            # If there are unknown faces, create new person(s) for them
+            if unknown_faces > 0:
                 for i in range(unknown_faces):
                     person_name = f"Person_{processing_stats['Num_of_people'] + 1}"
                     processing_stats["Num_of_people"] += 1
@@ -110,30 +225,275 @@ def process_images(input_dir: str, output_dir: str, similarity_threshold=SIMILAR
                     if copy_file_to_destination(image_path, person_dir, filename):
                         print(f"Created new person {person_name} and moved {filename} there")
                         processing_stats["processed_files"] += 1
+                        destinations.append(person_dir)
 
-            elif identified_person_ids:
-                # Copy to all identified person folders
-                for person_id in identified_person_ids:
-                    person_name = get_person_name(person_id)
-                    person_dir = os.path.join(output_dir, person_name if person_name else person_id)
-                    if copy_file_to_destination(image_path, person_dir, filename):
-                        print(f"Moved {filename} to {person_dir}")
-                        processing_stats["processed_files"] += 1
+    except Exception as e:
+        print(f"Error processing image {filename}: {e}")
+        error_dir = os.path.join(output_dir, "_errors")
+        if copy_file_to_destination(image_path, error_dir, filename):
+            processing_stats["errors"] += 1
+        return None
 
-                # If there are unknown faces, create new person(s) for them
-                if unknown_faces > 0:
-                    for i in range(unknown_faces):
-                        person_name = f"Person_{processing_stats['Num_of_people'] + 1}"
-                        processing_stats["Num_of_people"] += 1
-                        person_dir = os.path.join(output_dir, person_name)
-                        if copy_file_to_destination(image_path, person_dir, filename):
-                            print(f"Created new person {person_name} and moved {filename} there")
-                            processing_stats["processed_files"] += 1
+    return destinations
 
-        except Exception as e:
-            print(f"Error processing image {filename}: {e}")
-            error_dir = os.path.join(output_dir, "_errors")
-            if copy_file_to_destination(image_path, error_dir, filename):
-                processing_stats["errors"] += 1
-    
+def _load_checkpoint(checkpoint_path: str, input_dir: str):
+    """Return (done filenames, stats, interrupted filename) from a checkpoint of an interrupted run over input_dir.
+
+    The interrupted file was started but never finished; some of its faces may already be stored.
+    """
+    done, stats, interrupted = set(), None, None
+    if not os.path.exists(checkpoint_path):
+        return done, stats, interrupted
+    try:
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline() or "{}")
+            if header.get("input_dir") != os.path.abspath(input_dir):
+                return set(), None, None
+            stats = new_processing_stats()
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # torn final line from a crash
+                if "started" in entry:
+                    interrupted = entry["started"]
+                    continue
+                done.add(entry["file"])
+                stats = {**new_processing_stats(), **entry["stats"]}
+                if entry["file"] == interrupted:
+                    interrupted = None
+    except Exception as e:
+        print(f"Ignoring unreadable checkpoint {checkpoint_path}: {e}")
+        return set(), None, None
+    return done, stats, interrupted
+
+def get_checkpoint_progress(input_dir: str, output_dir: str):
+    """Return how many files an interrupted run over input_dir already processed, or None."""
+    done, stats, _ = _load_checkpoint(os.path.join(output_dir, CHECKPOINT_FILENAME), input_dir)
+    return len(done) if stats is not None else None
+
+def process_images_stream(input_dir: str, output_dir: str, similarity_threshold=SIMILARITY_THRESHOLD,
+                          cancel_event=None, resume=True):
+    """Process images one by one, yielding a progress event after every file.
+
+    Events are dicts with a "type" of "start", "file", "cancelled" or "done". Setting
+    cancel_event (a threading.Event) stops the run after the current file. Progress is
+    appended to a checkpoint in output_dir so an interrupted run resumes where it stopped;
+    the checkpoint is removed once the run completes.
+    """
+    checkFolders(input_dir, output_dir)
+    checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILENAME)
+
+    done, processing_stats, interrupted = _load_checkpoint(checkpoint_path, input_dir) if resume else (set(), None, None)
+    resumed = processing_stats is not None
+    if not resumed:
+        done, processing_stats, interrupted = set(), new_processing_stats(), None
+
+    filenames = []
+    for filename in sorted(os.listdir(input_dir)):
+        if not filename.lower().endswith(MEDIA_EXTENSIONS):
+            print(f"Skipping non-supported file: {filename}")
+            continue
+        filenames.append(filename)
+    pending = [filename for filename in filenames if filename not in done]
+
+    yield {"type": "start", "total": len(filenames), "completed": len(filenames) - len(pending),
+           "resumed": resumed, "stats": dict(processing_stats)}
+
+    dedup_index = new_dedup_index()
+    mode = "a" if resumed else "w"
+    with open(checkpoint_path, mode, encoding="utf-8") as checkpoint:
+        if not resumed:
+            checkpoint.write(json.dumps({"input_dir": os.path.abspath(input_dir)}) + "\n")
+            checkpoint.flush()
+
+        started = time.perf_counter()
+        for index, filename in enumerate(pending, start=1):
+            if cancel_event is not None and cancel_event.is_set():
+                yield {"type": "cancelled", "stats": dict(processing_stats)}
+                return
+
+            if filename == interrupted:
+                # The previous run stopped part way through this file; drop the faces it stored
+                forget_image(os.path.join(input_dir, filename))
+            checkpoint.write(json.dumps({"started": filename}) + "\n")
+            checkpoint.flush()
+
+            before = dict(processing_stats)
+            process_media_file(os.path.join(input_dir, filename), output_dir, processing_stats, dedup_index)
+            checkpoint.write(json.dumps({"file": filename, "stats": processing_stats}) + "\n")
+            checkpoint.flush()
+
+            elapsed = time.perf_counter() - started
+            yield {
+                "type": "file",
+                "filename": filename,
+                "completed": len(filenames) - len(pending) + index,
+                "total": len(filenames),
+                "delta": {key: processing_stats[key] - before[key] for key in processing_stats if processing_stats[key] != before[key]},
+                "stats": dict(processing_stats),
+                "files_per_second": index / elapsed if elapsed > 0 else 0.0
+            }
+
+    os.remove(checkpoint_path)
+    yield {"type": "done", "stats": dict(processing_stats)}
+
+def process_images(input_dir: str, output_dir: str, similarity_threshold=SIMILARITY_THRESHOLD):
+    processing_stats = new_processing_stats()
+    for event in process_images_stream(input_dir, output_dir, similarity_threshold):
+        processing_stats = event["stats"]
+    return processing_stats
+
+def _scan_input_dirs(input_dirs):
+    """Snapshot supported images and videos in input_dirs as {path: [size, mtime_ns]}."""
+    snapshot = {}
+    for input_dir in input_dirs:
+        try:
+            with os.scandir(input_dir) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.lower().endswith(MEDIA_EXTENSIONS):
+                        stat = entry.stat()
+                        snapshot[os.path.abspath(entry.path)] = [stat.st_size, stat.st_mtime_ns]
+        except FileNotFoundError:
+            print(f"Watched directory '{input_dir}' not found.")
+    return snapshot
+
+def _load_watch_state(state_path: str):
+    """Return the persisted watch state, or None when there is none."""
+    if not os.path.exists(state_path):
+        return None
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Ignoring unreadable watch state {state_path}: {e}")
+        return None
+
+def _save_watch_state(state_path: str, state: dict):
+    """Atomically persist the watch state."""
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+def watch_folders(input_dirs, output_dir: str, poll_interval=WATCH_POLL_INTERVAL, debounce_seconds=WATCH_DEBOUNCE_SECONDS,
+                  batch_size=WATCH_BATCH_SIZE, stop_event=None, process_existing=False, use_inotify=True):
+    """Watch input directories and organize new or changed images and videos as they arrive.
+
+    A file is processed once its size and mtime have been stable for debounce_seconds,
+    so partially written files are left alone. Directories are polled with os.scandir
+    snapshots; when inotify_simple is installed, inotify events wake the loop instead of
+    the poll timer. Models and the database connection stay loaded between batches.
+    """
+    input_dirs = [os.path.abspath(input_dir) for input_dir in input_dirs]
+    for input_dir in input_dirs:
+        checkFolders(input_dir, output_dir)
+    state_path = os.path.join(output_dir, WATCH_STATE_FILENAME)
+
+    state = _load_watch_state(state_path)
+    if state is None:
+        # Without process_existing, only files arriving from now on are picked up
+        state = {"processed": {} if process_existing else _scan_input_dirs(input_dirs),
+                 "stats": new_processing_stats()}
+        _save_watch_state(state_path, state)
+    state["stats"] = {**new_processing_stats(), **state["stats"]}
+    processed, processing_stats = state["processed"], state["stats"]
+    dedup_index = new_dedup_index()
+
+    inotify = None
+    if use_inotify and INotify is not None:
+        inotify = INotify()
+        watch_flags = inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.CREATE
+        for input_dir in input_dirs:
+            if os.path.isdir(input_dir):
+                inotify.add_watch(input_dir, watch_flags)
+        print("Watching with inotify.")
+    else:
+        print(f"Watching by polling every {poll_interval}s.")
+
+    pending = {}  # path -> (signature, first time that signature was seen)
+    try:
+        while stop_event is None or not stop_event.is_set():
+            now = time.monotonic()
+            snapshot = _scan_input_dirs(input_dirs)
+
+            ready = []
+            for path, signature in snapshot.items():
+                if processed.get(path) == signature:
+                    pending.pop(path, None)
+                    continue
+                seen = pending.get(path)
+                if seen is None or seen[0] != signature:
+                    pending[path] = (signature, now)
+                elif now - seen[1] >= debounce_seconds:
+                    ready.append(path)
+            for path in list(pending):
+                if path not in snapshot:
+                    del pending[path]
+
+            for start in range(0, len(ready), batch_size):
+                batch = ready[start:start + batch_size]
+                for path in batch:
+                    if path in processed:
+                        # The file changed since it was organized: drop its old faces first
+                        forget_image(path)
+                        if dedup_index is not None:
+                            dedup_index.remove(path)
+                    process_media_file(path, output_dir, processing_stats, dedup_index)
+                    processed[path] = pending.pop(path)[0]
+                _save_watch_state(state_path, state)
+                print(f"Organized {len(batch)} new file(s). Totals: {processing_stats}")
+                if stop_event is not None and stop_event.is_set():
+                    break
+
+            # Wake up early enough to finish debouncing pending files
+            if inotify is not None:
+                # Events only shorten the wait; the snapshot above decides what is new
+                timeout = debounce_seconds if pending else poll_interval * 5
+                inotify.read(timeout=int(timeout * 1000))
+            else:
+                timeout = min(poll_interval, debounce_seconds) if pending else poll_interval
+                if stop_event is not None:
+                    stop_event.wait(timeout)
+                else:
+                    time.sleep(timeout)
+    finally:
+        _save_watch_state(state_path, state)
+        if inotify is not None:
+            inotify.close()
     return processing_stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Organize images into person folders.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    process_parser = subparsers.add_parser("process", help="Process an input directory once.")
+    process_parser.add_argument("input_dir")
+    process_parser.add_argument("--output", required=True, help="Output directory for person folders.")
+
+    watch_parser = subparsers.add_parser("watch", help="Watch input directories and ingest new images continuously.")
+    watch_parser.add_argument("input_dirs", nargs="+")
+    watch_parser.add_argument("--output", required=True, help="Output directory for person folders.")
+    watch_parser.add_argument("--poll-interval", type=float, default=WATCH_POLL_INTERVAL)
+    watch_parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE_SECONDS,
+                              help="Seconds a file must stay unchanged before it is processed.")
+    watch_parser.add_argument("--batch-size", type=int, default=WATCH_BATCH_SIZE)
+    watch_parser.add_argument("--process-existing", action="store_true",
+                              help="Also process images already present when the watch starts for the first time.")
+    watch_parser.add_argument("--no-inotify", action="store_true", help="Always poll, even if inotify is available.")
+
+    args = parser.parse_args()
+    try:
+        if args.command == "process":
+            print(process_images(args.input_dir, args.output))
+        else:
+            watch_folders(args.input_dirs, args.output, poll_interval=args.poll_interval, debounce_seconds=args.debounce,
+                          batch_size=args.batch_size, process_existing=args.process_existing,
+                          use_inotify=not args.no_inotify)
+    except KeyboardInterrupt:
+        print("Stopped.")
+    finally:
+        close_database()
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 import os
+import errno
+import filecmp
 import shutil
 
-from databaseManager import MongoDBManager
-from config import CONNECTION_URI, DATABASE_NAME 
+from storageBackend import create_storage_backend
 
-db_manager = MongoDBManager(connection_uri=CONNECTION_URI, database_name=DATABASE_NAME)
+db_manager = create_storage_backend()
 
 def rename_folder_on_disk(old_name_label: str, new_name_label: str, output_dir: str) -> bool:
     """
@@ -25,35 +26,60 @@ def rename_folder_on_disk(old_name_label: str, new_name_label: str, output_dir:
         print(f"Old folder '{old_name_label}' not found at '{old_folder_path}'.")
         return False
 
-def merge_person_folders(target_person_id: str, source_person_ids: list, output_dir: str) -> bool:
+def _unique_destination(folder_path: str, filename: str) -> str:
+    """
+    Returns a path inside folder_path for filename that does not exist yet.
+    """
+    base, ext = os.path.splitext(filename)
+    candidate = os.path.join(folder_path, filename)
+    counter = 1
+    while os.path.exists(candidate):
+        candidate = os.path.join(folder_path, f"{base}_{counter}{ext}")
+        counter += 1
+    return candidate
+
+def _move_file(source_path: str, dest_path: str):
+    """
+    Moves a file with os.replace, falling back to a copy when crossing filesystems.
+    """
+    try:
+        os.replace(source_path, dest_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(source_path, dest_path)
+
+def _same_photo(path_a: str, path_b: str) -> bool:
+    """
+    Compares the file contents byte for byte; equal size and mtime alone do not prove a copy.
+    """
+    return filecmp.cmp(path_a, path_b, shallow=False)
+
+def merge_person_folders(target_person_id: str, source_person_ids: list, output_dir: str, person_labels: dict = None) -> bool:
     """
     Merges content from source person folders into the target person's folder
     within the specified output_dir and then deletes the source folders.
+    Every regular file is moved rather than copied; a file that already exists in the
+    target is dropped and other name collisions get a numeric suffix. A source folder
+    is only removed once it is empty.
     """
     try:
-        targetData = db_manager.getPerson(target_person_id)
-        if not targetData:
+        if person_labels is None:
+            person_labels = db_manager.get_person_labels([target_person_id] + list(source_person_ids))
+        if target_person_id not in person_labels:
             print(f"Target person with ID '{target_person_id}' not found in DB.")
             return False
         
-        targetFolder = target_person_id if not targetData["name_label"] else targetData["name_label"]
+        targetFolder = person_labels[target_person_id] or target_person_id
         targetFolderPath = os.path.join(output_dir, targetFolder)
         print(f"Target folder path: {targetFolderPath}")
 
         sourceFolder = []
         for source in source_person_ids:
-            try:
-                sourceData = db_manager.getPerson(source)
-                if not sourceData:
-                    print(f"Source person with ID '{source}' not found in DB, Skipping.")
-                    continue
-            except Exception as e:
-                print(f"Error in the retriving source {source} error is : {e}")
-            
-            sourceIndvFolder = source if not sourceData["name_label"] else sourceData["name_label"]
-            sourceFolder.append(sourceIndvFolder)
-
-        image_exts = {'.jpg', '.jpeg', '.png'}
+            if source not in person_labels:
+                print(f"Source person with ID '{source}' not found in DB, Skipping.")
+                continue
+            sourceFolder.append(person_labels[source] or source)
 
         for Folder in sourceFolder:
             try:
@@ -62,19 +88,37 @@ def merge_person_folders(target_person_id: str, source_person_ids: list, output_
                     print(f"Source folder '{folderPath}' does not exist, skipping.")
                     continue
 
-                for filename in os.listdir(folderPath):
-                    filepath = os.path.join(folderPath, filename)
-                    
-                    if os.path.isfile(filepath):
-                        _, ext = os.path.splitext(filename)
-                        if ext.lower() in image_exts:
-                            try:
-                                shutil.copy2(filepath,targetFolderPath)
-                                print(f"Photo {filename} is copied to {targetFolderPath}")
-                            except Exception as e:
-                                print(f" Error Coping Photo {filename} : {e}")
-                shutil.rmtree(folderPath)
-                print(f"Merged content from '{Folder}' into '{targetFolder}' and removed '{Folder}'.")
+                if not os.path.exists(targetFolderPath):
+                    # Nothing to merge into yet: a single directory rename is enough
+                    os.replace(folderPath, targetFolderPath)
+                    print(f"Renamed '{Folder}' to '{targetFolder}'.")
+                    continue
+
+                moved, failed = 0, 0
+                with os.scandir(folderPath) as entries:
+                    for entry in entries:
+                        if not entry.is_file():
+                            continue
+                        try:
+                            existing = os.path.join(targetFolderPath, entry.name)
+                            if os.path.exists(existing) and _same_photo(entry.path, existing):
+                                os.remove(entry.path)
+                                continue
+                            _move_file(entry.path, _unique_destination(targetFolderPath, entry.name))
+                            moved += 1
+                        except Exception as e:
+                            failed += 1
+                            print(f" Error Moving File {entry.name} : {e}")
+                if failed:
+                    print(f"Kept '{Folder}' because {failed} file(s) could not be moved.")
+                    continue
+                try:
+                    os.rmdir(folderPath)
+                except OSError:
+                    # Subdirectories are left alone rather than deleted
+                    print(f"Moved {moved} file(s) from '{Folder}' into '{targetFolder}'; kept '{Folder}' because it is not empty.")
+                    continue
+                print(f"Moved {moved} file(s) from '{Folder}' into '{targetFolder}' and removed '{Folder}'.")
             except Exception as e:
                 print(f"Error merging folder '{Folder}': {e}")
         return True
@@ -1,11 +1,13 @@
 # Main GUI application for face recognition and image organization using Streamlit
 import streamlit as st
 import os
+import math
 from PIL import Image
-from databaseManager import MongoDBManager
+from storageBackend import create_storage_backend
 from faceProcessing import update_person_name, merge_persons, close_database
-from fileOrganizer import process_images
-from config import CONNECTION_URI, DATABASE_NAME
+from fileOrganizer import process_images_stream, get_checkpoint_progress
+from duplicateFinder import DuplicateFinder
+from config import PERSONS_PAGE_SIZE, VIDEO_EXTENSIONS
 import time
 
 # Configure Streamlit page settings
@@ -23,15 +25,20 @@ if 'output_directory' not in st.session_state:
 # Cache database connection for better performance
 @st.cache_resource
 def get_db_manager():
-    """Initialize and cache MongoDB connection."""
+    """Initialize and cache the storage backend connection."""
     try:
-        return MongoDBManager(connection_uri=CONNECTION_URI, database_name=DATABASE_NAME)
+        return create_storage_backend()
     except Exception as e:
-        st.error(f"Failed to connect to MongoDB: {e}")
+        st.error(f"Failed to open the database: {e}")
         return None
 
 db_manager = get_db_manager()
 
+@st.cache_resource
+def get_duplicate_finder(_db_manager):
+    """Initialize and cache the duplicate finder so its pair cache survives reruns."""
+    return DuplicateFinder(_db_manager)
+
 # Utility functions for data refresh and UI updates
 def refresh_data():
     """Clear cache to force data reload."""
@@ -41,23 +48,53 @@ def force_rerun():
     """Trigger page rerun to refresh UI."""
     st.rerun()
 
-def display_image_preview(person_id, all_persons_data):
-    """Display preview image for a person with error handling."""
-    person_data = all_persons_data.get(person_id)
+def display_image_preview(person_id, persons_data, width=None):
+    """Display preview image for a person row with error handling."""
+    person_data = persons_data.get(person_id)
     if person_data:
-        image_paths = person_data.get("representative_image_paths", [])
-        if image_paths:
-            first_image_path = image_paths[0]
+        first_image_path = person_data.get("preview_image_path")
+        display_name = person_data.get("name_label") or person_id
+        if first_image_path:
             if os.path.exists(first_image_path):
+                if first_image_path.lower().endswith(VIDEO_EXTENSIONS):
+                    st.video(first_image_path)
+                    st.caption(display_name)
+                    return
                 try:
                     image = Image.open(first_image_path)
-                    st.image(image, caption=f"Preview for {person_data.get('name_label', person_id)}", use_container_width =True)
+                    if width:
+                        image.thumbnail((width * 2, width * 2))
+                        st.image(image, caption=display_name, width=width)
+                    else:
+                        st.image(image, caption=f"Preview for {display_name}", use_container_width =True)
                 except Exception as e:
                     st.warning(f"Could not load preview: {e}")
             else:
                 st.warning(f"Image not found: {first_image_path}")
         else:
-            st.info(f"No representative image for {person_data.get('name_label', person_id)}.")
+            st.info(f"No representative image for {display_name}.")
+
+def person_option_label(row):
+    """Selectbox label for a person row."""
+    return f"{row.get('name_label') or 'N/A'} ({row['person_id']})"
+
+def person_page_controls(key_prefix):
+    """Render prefix search and page controls and return (rows of the current page, total matches)."""
+    col_search, col_page = st.columns([3, 1])
+    search = col_search.text_input(
+        "Search by name or ID prefix (case-sensitive)", key=f"{key_prefix}_search"
+    ).strip() or None
+    total = db_manager.count_persons(search)
+    num_pages = max(1, math.ceil(total / PERSONS_PAGE_SIZE))
+
+    page_key = f"{key_prefix}_page"
+    if st.session_state.get(page_key, 1) > num_pages:
+        st.session_state[page_key] = num_pages
+    page_number = col_page.number_input(
+        f"Page (of {num_pages})", min_value=1, max_value=num_pages, value=1, step=1, key=page_key
+    )
+    rows = db_manager.get_persons_page(page=page_number - 1, page_size=PERSONS_PAGE_SIZE, search=search)
+    return rows, total
 
 # Navigation sidebar setup
 st.sidebar.title("Navigation")
@@ -77,12 +114,8 @@ if db_manager:
         # --- Key Metrics ---
         st.header("Key Metrics")
         try:
-            all_persons = db_manager.get_all_persons()
-            num_persons = len(all_persons)
-            
-            total_images = 0
-            for person in all_persons.values():
-                total_images += len(person.get("representative_image_paths", []))
+            num_persons = db_manager.count_persons()
+            total_images = db_manager.get_total_image_count()
             
             col1, col2 = st.columns(2)
             col1.metric("Total People", num_persons)
@@ -98,15 +131,22 @@ if db_manager:
             refresh_data()
         
         try:
-            all_persons_data = db_manager.get_all_persons()
-            if all_persons_data:
+            page_rows, total_matches = person_page_controls("dashboard")
+            if page_rows:
                 person_list = []
-                for person_id, data in all_persons_data.items():
-                    name = data.get("name_label", "N/A")
-                    num_images = len(data.get("representative_image_paths", []))
-                    person_list.append({"Person ID": person_id, "Name": name, "Image Count": num_images})
+                for row in page_rows:
+                    name = row.get("name_label") or "N/A"
+                    person_list.append({"Person ID": row["person_id"], "Name": name, "Image Count": row["image_count"]})
                 
+                st.caption(f"{total_matches} matching person(s)")
                 st.dataframe(person_list, use_container_width=True)
+
+                if st.checkbox("Show thumbnails", key="dashboard_thumbnails"):
+                    rows_by_id = {row["person_id"]: row for row in page_rows}
+                    thumbnail_cols = st.columns(6)
+                    for index, row in enumerate(page_rows):
+                        with thumbnail_cols[index % 6]:
+                            display_image_preview(row["person_id"], rows_by_id, width=96)
             else:
                 st.info("No persons found in the database.")
         except Exception as e:
@@ -129,6 +169,11 @@ if db_manager:
         )
         st.session_state.output_directory = current_output_dir_input
 
+        if input_dir and st.session_state.output_directory and os.path.isdir(st.session_state.output_directory):
+            resumable = get_checkpoint_progress(input_dir, st.session_state.output_directory)
+            if resumable is not None:
+                st.info(f"An interrupted run over this folder was found ({resumable} files done). Processing will resume from there.")
+
         # Image processing execution
         if st.button("Start Processing", key="start_processing"):
             if not input_dir:
@@ -142,13 +187,36 @@ if db_manager:
                     st.warning("Output directory not found. Creating it.")
                     os.makedirs(st.session_state.output_directory, exist_ok=True)
 
-                with st.spinner("Processing images... This may take a while."):
-                    try:
-                        stats = process_images(input_dir, st.session_state.output_directory)
-                        st.success("Image processing complete!")
-                        st.json(stats)
-                    except Exception as e:
-                        st.error(f"An error occurred during processing: {e}")
+                # Pressing Stop reruns the script, which ends this loop; the checkpoint keeps the progress
+                st.button("Stop Processing", key="stop_processing")
+                progress_bar = st.progress(0.0, text="Starting...")
+                status_area = st.empty()
+                try:
+                    for event in process_images_stream(input_dir, st.session_state.output_directory):
+                        if event["type"] == "start":
+                            if event["resumed"]:
+                                st.info(f"Resuming: {event['completed']} of {event['total']} files already processed.")
+                            if event["total"]:
+                                progress_bar.progress(event["completed"] / event["total"], text=f"{event['completed']}/{event['total']} files")
+                        elif event["type"] == "file":
+                            progress_bar.progress(
+                                event["completed"] / event["total"],
+                                text=f"{event['completed']}/{event['total']} files - {event['filename']}"
+                            )
+                            status_area.markdown(
+                                f"**Throughput:** {event['files_per_second']:.2f} files/s &nbsp; "
+                                f"**People:** {event['stats']['Num_of_people']} &nbsp; "
+                                f"**No faces:** {event['stats']['no_faces']} &nbsp; "
+                                f"**Duplicates:** {event['stats']['exact_duplicates'] + event['stats']['near_duplicates']} &nbsp; "
+                                f"**Videos:** {event['stats']['videos']} &nbsp; "
+                                f"**Errors:** {event['stats']['errors']}"
+                            )
+                        elif event["type"] == "done":
+                            progress_bar.progress(1.0, text="Done")
+                            st.success("Image processing complete!")
+                            st.json(event["stats"])
+                except Exception as e:
+                    st.error(f"An error occurred during processing: {e}")
                 refresh_data()
 
     elif page == "Person Management":
@@ -165,8 +233,9 @@ if db_manager:
         
         if st.session_state.output_directory and os.path.isdir(st.session_state.output_directory):
             try:
-                all_persons_data = db_manager.get_all_persons() 
-                person_options = {f"{data.get('name_label', 'N/A')} ({person_id})": person_id for person_id, data in all_persons_data.items()}
+                page_rows, total_matches = person_page_controls("manage")
+                all_persons_data = {row["person_id"]: row for row in page_rows}
+                person_options = {person_option_label(row): row["person_id"] for row in page_rows}
 
                 if person_options:
                     # --- Rename Person ---
@@ -210,13 +279,22 @@ if db_manager:
                         target_person_key = st.selectbox(
                             "Select Target Person (to merge into)", options=list(person_options.keys()), key="target_merge"
                         )
+
+                        # Sources have their own search and pages; picks are kept while browsing
+                        st.write("**Find Source Persons**")
+                        source_page_rows, _ = person_page_controls("merge_source")
+                        chosen_sources = st.session_state.setdefault("merge_source_choices", {})
+                        source_options = {**chosen_sources, **{person_option_label(row): row["person_id"] for row in source_page_rows}}
                         source_persons_keys = st.multiselect(
-                            "Select Source Persons (to be merged)", options=list(person_options.keys()), key="source_merge"
+                            "Select Source Persons (to be merged)", options=list(source_options.keys()),
+                            default=list(chosen_sources.keys()), key="source_merge"
                         )
-                        
+                        st.session_state.merge_source_choices = {key: source_options[key] for key in source_persons_keys}
+                        source_persons_data = db_manager.get_person_rows([source_options[key] for key in source_persons_keys])
+
                         if st.button("Merge Persons"):
                             target_id = person_options[target_person_key]
-                            source_ids = [person_options[key] for key in source_persons_keys]
+                            source_ids = [source_options[key] for key in source_persons_keys]
                             
                             if target_id in source_ids:
                                 st.error("Target person cannot be in the source list.")
@@ -225,6 +303,9 @@ if db_manager:
                             else:
                                 if merge_persons(target_id, source_ids, st.session_state.output_directory):
                                     st.success("Successfully merged persons and their folders.")
+                                    # The merged sources no longer exist
+                                    st.session_state.pop("merge_source_choices", None)
+                                    st.session_state.pop("source_merge", None)
                                     refresh_data()
                                     time.sleep(0.5)
                                     st.rerun()
@@ -240,11 +321,58 @@ if db_manager:
                         st.write("**Sources Preview**")
                         if source_persons_keys:
                             for source_key in source_persons_keys:
-                                source_id_to_preview = person_options[source_key]
-                                display_image_preview(source_id_to_preview, all_persons_data)
+                                source_id_to_preview = source_options[source_key]
+                                display_image_preview(source_id_to_preview, source_persons_data)
                         else:
                             st.info("No sources selected to preview.")
 
+                    st.markdown("---")
+
+                    # --- Suggested Duplicates ---
+                    st.header("Suggested Duplicates")
+
+                    duplicate_finder = get_duplicate_finder(db_manager)
+                    duplicate_finder.refresh_async()
+
+                    if st.button("Refresh Suggestions"):
+                        duplicate_finder.refresh_async(force=True)
+                        force_rerun()
+
+                    duplicate_groups = duplicate_finder.get_groups()
+                    if duplicate_finder.last_error:
+                        st.error(f"Could not compute duplicate suggestions: {duplicate_finder.last_error}")
+                    elif not duplicate_groups:
+                        if duplicate_finder.is_running():
+                            st.info("Computing duplicate suggestions in the background...")
+                        else:
+                            st.info("No likely duplicates found.")
+
+                    for index, group in enumerate(duplicate_groups[:10]):
+                        group_rows = db_manager.get_person_rows(group["person_ids"])
+                        group_ids = [pid for pid in group["person_ids"] if pid in group_rows]
+                        if len(group_ids) < 2:
+                            continue
+                        # Keep a named person as the merge target when there is one
+                        group_ids.sort(key=lambda pid: (group_rows[pid].get("name_label") is None, pid))
+                        target_id, source_ids = group_ids[0], group_ids[1:]
+                        labels = [person_option_label(group_rows[pid]) for pid in group_ids]
+
+                        st.write(f"**Similarity at least {group['similarity']:.3f}:** " + ", ".join(labels))
+                        preview_cols = st.columns(len(group_ids))
+                        for preview_col, pid in zip(preview_cols, group_ids):
+                            with preview_col:
+                                display_image_preview(pid, group_rows)
+
+                        if st.button(f"Merge into {labels[0]}", key=f"merge_duplicates_{index}"):
+                            if merge_persons(target_id, source_ids, st.session_state.output_directory):
+                                st.success("Successfully merged suggested duplicates.")
+                                refresh_data()
+                                duplicate_finder.refresh_async(force=True)
+                                time.sleep(0.5)
+                                st.rerun()
+                            else:
+                                st.error("Failed to merge suggested duplicates.")
+
 
                 else:
                     st.info("No persons available to manage.")
@@ -252,4 +380,4 @@ if db_manager:
                 st.error(f"Failed to load person management tools: {e}")
 
 else:
-    st.error("Database connection failed. Please check your MongoDB instance and configuration.")
\ No newline at end of file
+    st.error("Database connection failed. Please check the storage backend in config.py and, for MongoDB, that the server is running.")
\ No newline at end of file
@@ -0,0 +1,248 @@
+# Long-running local face identification service with dynamic micro-batching
+import argparse
+import asyncio
+import base64
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from faceProcessing import (detect_faces_yolo_batch, get_face_embeddings_batch, get_representative_snapshot,
+                            identify_person, db_manager, close_database)
+from config import (SIMILARITY_THRESHOLD, SERVICE_HOST, SERVICE_PORT, SERVICE_UNIX_SOCKET,
+                    SERVICE_MAX_BATCH_SIZE, SERVICE_MAX_WAIT_MS)
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+class MicroBatcher:
+    def __init__(self, max_batch_size=SERVICE_MAX_BATCH_SIZE, max_wait_ms=SERVICE_MAX_WAIT_MS):
+        """Group concurrent identification requests into batches that share one inference pass."""
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        # A single worker keeps inference serialized on the shared models
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._queue = None
+        self._task = None
+        self.stats = {"requests": 0, "batches": 0, "faces": 0, "errors": 0}
+
+    def start(self):
+        """Start the batching loop on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the batching loop and the inference worker."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, payload):
+        """Queue one request and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((payload, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        """Collect up to max_batch_size requests or until max_wait elapses, then run them together."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            started = time.perf_counter()
+            payloads = [payload for payload, _, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, self._infer_batch, payloads)
+            except Exception as e:
+                print(f"Error running identification batch: {e}")
+                results = [{"error": str(e)} for _ in batch]
+            finished = time.perf_counter()
+
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            for (_, future, enqueued), result in zip(batch, results):
+                result["metrics"] = {
+                    "batch_size": len(batch),
+                    "queue_ms": (started - enqueued) * 1000,
+                    "inference_ms": (finished - started) * 1000,
+                    "total_ms": (finished - enqueued) * 1000
+                }
+                if not future.done():
+                    future.set_result(result)
+
+    def _infer_batch(self, payloads):
+        """Decode, detect, embed and match every request of a batch with one call per model."""
+        results = [{"faces": []} for _ in payloads]
+        images = []
+        for index, payload in enumerate(payloads):
+            try:
+                images.append(_decode_image(payload))
+            except Exception as e:
+                images.append(None)
+                results[index] = {"error": f"Could not read image: {e}"}
+                self.stats["errors"] += 1
+
+        valid = [index for index, image in enumerate(images) if image is not None]
+        detections = detect_faces_yolo_batch([images[index] for index in valid], with_confidence=True)
+
+        crops, owners = [], []
+        for index, boxes in zip(valid, detections):
+            for bbox, confidence in boxes:
+                x1, y1, x2, y2 = bbox
+                if x1 >= x2 or y1 >= y2:
+                    continue
+                crops.append(images[index][y1:y2, x1:x2])
+                owners.append((index, bbox, confidence))
+        if not crops:
+            return results
+
+        embeddings = get_face_embeddings_batch(crops)
+        if embeddings is None:
+            for index, _, _ in owners:
+                results[index] = {"error": "Could not compute face embeddings"}
+            self.stats["errors"] += 1
+            return results
+
+        # Matching reads the memory-mapped snapshot shared with other processes
+        matches = get_representative_snapshot().match(embeddings.detach().cpu().numpy(), SIMILARITY_THRESHOLD)
+
+        faces = []
+        for (index, bbox, confidence), embedding, (person_id, similarity) in zip(owners, embeddings, matches):
+            payload = payloads[index]
+            if payload.get("register") and payload.get("image_path"):
+                # Registration goes through the regular write path and may create a person
+                person_id = identify_person(embedding, SIMILARITY_THRESHOLD, payload["image_path"],
+                                            bbox=bbox, confidence=confidence)
+            faces.append((index, {"bbox": bbox, "confidence": confidence,
+                                  "person_id": person_id, "similarity": similarity}))
+
+        labels = db_manager.get_person_labels({face["person_id"] for _, face in faces if face["person_id"]})
+        for index, face in faces:
+            face["name_label"] = labels.get(face["person_id"])
+            if "faces" in results[index]:
+                results[index]["faces"].append(face)
+        self.stats["faces"] += len(faces)
+        return results
+
+def _decode_image(payload):
+    """Load the RGB image referenced by a request, from a local path or base64 data."""
+    if payload.get("image_path"):
+        image = Image.open(payload["image_path"])
+    elif payload.get("image_base64"):
+        image = Image.open(io.BytesIO(base64.b64decode(payload["image_base64"])))
+    else:
+        raise ValueError("Request needs 'image_path' or 'image_base64'")
+    return np.array(image.convert('RGB'))
+
+class IdentificationServer:
+    def __init__(self, batcher):
+        """Minimal HTTP/1.1 front end (TCP or Unix socket) for a MicroBatcher."""
+        self.batcher = batcher
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one keep-alive connection."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, response = await self._route(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self._write_response(writer, status, response, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, body):
+        """Dispatch one request to its handler."""
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        if method == "GET" and path == "/metrics":
+            return 200, self.batcher.stats
+        if method == "POST" and path == "/identify":
+            try:
+                payload = json.loads(body or b"{}")
+            except json.JSONDecodeError as e:
+                return 400, {"error": f"Invalid JSON: {e}"}
+            try:
+                result = await self.batcher.submit(payload)
+            except Exception as e:
+                return 500, {"error": str(e)}
+            return (400 if "error" in result else 200), result
+        return 404, {"error": f"No route for {method} {path}"}
+
+    def _write_response(self, writer, status, response, keep_alive):
+        """Write a JSON response."""
+        body = json.dumps(response).encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+
+async def serve(host=SERVICE_HOST, port=SERVICE_PORT, unix_socket=SERVICE_UNIX_SOCKET,
+                max_batch_size=SERVICE_MAX_BATCH_SIZE, max_wait_ms=SERVICE_MAX_WAIT_MS):
+    """Run the identification service until cancelled."""
+    batcher = MicroBatcher(max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    batcher.start()
+    server_handler = IdentificationServer(batcher).handle_connection
+    if unix_socket:
+        server = await asyncio.start_unix_server(server_handler, path=unix_socket)
+        print(f"Identification service listening on unix:{unix_socket}")
+    else:
+        server = await asyncio.start_server(server_handler, host=host, port=port)
+        print(f"Identification service listening on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Local face identification service with micro-batching.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--unix-socket", default=SERVICE_UNIX_SOCKET, help="Listen on a Unix socket instead of TCP.")
+    parser.add_argument("--max-batch-size", type=int, default=SERVICE_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=SERVICE_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix_socket, args.max_batch_size, args.max_wait_ms))
+    except KeyboardInterrupt:
+        print("Identification service stopped.")
+    finally:
+        close_database()
+
+if __name__ == "__main__":
+    main()
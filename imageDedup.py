@@ -0,0 +1,115 @@
+# Exact and near-duplicate image detection ahead of face inference
+import hashlib
+from PIL import Image
+
+HASH_BITS = 64
+
+def content_hash(image_path, chunk_size=1 << 20):
+    """Fast hash of the raw file bytes; equal hashes mean identical files."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(image_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def dhash(image_path):
+    """64-bit difference hash: compares neighbouring pixels of a 9x8 grayscale thumbnail."""
+    with Image.open(image_path) as img:
+        # Let JPEG decoding downscale early; the hash only needs a tiny image
+        img.draft("L", (64, 64))
+        pixels = list(img.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+def hamming_distance(hash_a, hash_b):
+    """Number of differing bits between two hashes."""
+    return bin(hash_a ^ hash_b).count("1")
+
+class DedupIndex:
+    def __init__(self, max_distance=4):
+        """Index of processed images by content hash and by perceptual hash.
+
+        Near-duplicate lookup splits the 64-bit hash into max_distance + 1 bands: two hashes
+        within max_distance bits must agree exactly on at least one band, so only images
+        sharing a band value are compared.
+        """
+        self.max_distance = max_distance
+        band_count = max_distance + 1
+        width = HASH_BITS // band_count
+        self._bands = []
+        start = 0
+        for band in range(band_count):
+            end = HASH_BITS if band == band_count - 1 else start + width
+            self._bands.append((start, (1 << (end - start)) - 1))
+            start = end
+
+        self._exact = {}                                # content hash -> original path
+        self._near = [dict() for _ in self._bands]      # band value -> [(dhash, original path)]
+        self._assignments = {}                          # original path -> destination directories
+        self._hashes = {}                               # original path -> (content hash, dhash)
+
+    def find_duplicate(self, image_path):
+        """Return (kind, original_path, hashes) where kind is "exact", "near" or None.
+
+        An image never matches its own earlier registration, so a file that changed in
+        place is treated as new.
+        """
+        file_hash = content_hash(image_path)
+        if self._exact.get(file_hash, image_path) != image_path:
+            return "exact", self._exact[file_hash], (file_hash, None)
+
+        try:
+            perceptual_hash = dhash(image_path)
+        except Exception as e:
+            print(f"Could not compute perceptual hash for {image_path}: {e}")
+            return None, None, (file_hash, None)
+
+        best_path, best_distance = None, self.max_distance + 1
+        for (shift, mask), buckets in zip(self._bands, self._near):
+            for candidate_hash, candidate_path in buckets.get((perceptual_hash >> shift) & mask, ()):
+                if candidate_path == image_path:
+                    continue
+                distance = hamming_distance(perceptual_hash, candidate_hash)
+                if distance < best_distance:
+                    best_path, best_distance = candidate_path, distance
+        if best_path is not None:
+            return "near", best_path, (file_hash, perceptual_hash)
+        return None, None, (file_hash, perceptual_hash)
+
+    def add(self, image_path, hashes, destinations):
+        """Register a processed original and the directories it was organized into."""
+        file_hash, perceptual_hash = hashes
+        self.remove(image_path)
+        self._exact.setdefault(file_hash, image_path)
+        self._hashes[image_path] = hashes
+        if perceptual_hash is not None:
+            for (shift, mask), buckets in zip(self._bands, self._near):
+                buckets.setdefault((perceptual_hash >> shift) & mask, []).append((perceptual_hash, image_path))
+        self._assignments[image_path] = list(destinations)
+
+    def get_assignments(self, original_path):
+        """Destination directories of a registered original, or None if it is unknown."""
+        return self._assignments.get(original_path)
+
+    def remove(self, image_path):
+        """Forget a registered original, e.g. because the file changed and is reprocessed."""
+        hashes = self._hashes.pop(image_path, None)
+        self._assignments.pop(image_path, None)
+        if hashes is None:
+            return
+        file_hash, perceptual_hash = hashes
+        if self._exact.get(file_hash) == image_path:
+            del self._exact[file_hash]
+        if perceptual_hash is not None:
+            for (shift, mask), buckets in zip(self._bands, self._near):
+                band = (perceptual_hash >> shift) & mask
+                remaining = [entry for entry in buckets.get(band, ()) if entry[1] != image_path]
+                if remaining:
+                    buckets[band] = remaining
+                else:
+                    buckets.pop(band, None)
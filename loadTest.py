@@ -0,0 +1,95 @@
+# Load-test client for the identification service: throughput versus p99 latency
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from config import SERVICE_HOST, SERVICE_PORT, SERVICE_UNIX_SOCKET
+
+async def _open_connection(host, port, unix_socket):
+    """Open a keep-alive connection to the service."""
+    if unix_socket:
+        return await asyncio.open_unix_connection(unix_socket)
+    return await asyncio.open_connection(host, port)
+
+async def _identify(reader, writer, host, payload):
+    """Send one /identify request and return the decoded JSON response."""
+    body = json.dumps(payload).encode('utf-8')
+    writer.write(
+        (f"POST /identify HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+         f"Content-Length: {len(body)}\r\n\r\n").encode('latin-1') + body
+    )
+    await writer.drain()
+
+    await reader.readline()  # status line
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return json.loads(await reader.readexactly(int(headers.get('content-length', 0))))
+
+async def _worker(args, payloads, deadline, latencies, batch_sizes, errors):
+    """Issue requests back to back on one connection until the deadline."""
+    reader, writer = await _open_connection(args.host, args.port, args.unix_socket)
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await _identify(reader, writer, args.host, next(payloads))
+            latencies.append(time.perf_counter() - started)
+            if "error" in response:
+                errors.append(response["error"])
+            batch_sizes.append(response.get("metrics", {}).get("batch_size", 0))
+    finally:
+        writer.close()
+
+def _percentile(values, percentile):
+    """Nearest-rank percentile of a list of values."""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(percentile / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+async def run_level(args, concurrency):
+    """Run one concurrency level and return its summary row."""
+    payloads = itertools.cycle([{"image_path": path} for path in args.image])
+    latencies, batch_sizes, errors = [], [], []
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*(
+        _worker(args, payloads, deadline, latencies, batch_sizes, errors) for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000 if latencies else 0.0,
+        "p99_ms": _percentile(latencies, 99) * 1000 if latencies else 0.0,
+        "mean_batch": sum(batch_sizes) / len(batch_sizes) if batch_sizes else 0.0,
+        "errors": len(errors)
+    }
+
+async def run(args):
+    """Sweep the requested concurrency levels and print a throughput/latency table."""
+    print(f"{'conc':>5} {'requests':>9} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'batch':>6} {'errors':>7}")
+    for concurrency in args.concurrency:
+        row = await run_level(args, concurrency)
+        print(f"{row['concurrency']:>5} {row['requests']:>9} {row['throughput']:>9.1f} "
+              f"{row['p50_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['mean_batch']:>6.1f} {row['errors']:>7}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure identification service throughput versus p99 latency.")
+    parser.add_argument("--image", action="append", required=True,
+                        help="Image path readable by the service (repeat for several images).")
+    parser.add_argument("--concurrency", type=lambda value: [int(v) for v in value.split(",")],
+                        default=[1, 2, 4, 8, 16, 32], help="Comma-separated concurrency levels.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--unix-socket", default=SERVICE_UNIX_SOCKET)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Command-line maintenance tasks for the face database
+import argparse
+from storageBackend import create_storage_backend, COMPACTION_STRATEGIES
+from config import CONNECTION_URI, DATABASE_NAME, SNAPSHOT_DIR
+
+def compact(args):
+    """Compact every person document holding more embeddings than the cap."""
+    db_manager = create_storage_backend()
+    try:
+        compacted = db_manager.compact_all_persons(strategy=args.strategy)
+        print(f"Compacted {compacted} person document(s).")
+    finally:
+        db_manager.close()
+
+def migrate_faces(args):
+    """Move image paths out of person documents into the faces collection (MongoDB only)."""
+    from databaseManager import MongoDBManager
+    db_manager = MongoDBManager(connection_uri=CONNECTION_URI, database_name=DATABASE_NAME)
+    try:
+        db_manager.migrate_to_face_collection()
+    finally:
+        db_manager.close()
+
+def build_snapshot(args):
+    """Write the memory-mapped representative embedding snapshot."""
+    db_manager = create_storage_backend()
+    try:
+        db_manager.refresh_embedding_snapshot(args.path)
+    finally:
+        db_manager.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Face database maintenance tasks.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compact_parser = subparsers.add_parser("compact", help="Compact oversized person documents.")
+    compact_parser.add_argument("--strategy", choices=COMPACTION_STRATEGIES, default=None,
+                                help="Compaction strategy (defaults to the one in config.py).")
+    compact_parser.set_defaults(func=compact)
+
+    migrate_parser = subparsers.add_parser("migrate-faces", help="Move face data into the faces collection.")
+    migrate_parser.set_defaults(func=migrate_faces)
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="Build or refresh the embedding snapshot.")
+    snapshot_parser.add_argument("--path", default=SNAPSHOT_DIR, help="Snapshot directory.")
+    snapshot_parser.set_defaults(func=build_snapshot)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
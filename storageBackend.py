@@ -0,0 +1,215 @@
+# Storage backend interface shared by the MongoDB and embedded stores
+import random
+from abc import ABC, abstractmethod
+import torch
+import numpy as np
+from embeddingSnapshot import EmbeddingSnapshot
+from config import STORAGE_BACKEND, CONNECTION_URI, DATABASE_NAME, EMBEDDED_STORE_DIR, SNAPSHOT_DIR
+
+STORAGE_BACKENDS = ("mongodb", "embedded")
+COMPACTION_STRATEGIES = ("reservoir", "kmedoids", "centroid")
+# Same choice as aiModels, without loading the models just to store embeddings
+DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+def create_storage_backend(backend=STORAGE_BACKEND):
+    """Open the storage backend selected in config.py."""
+    # Imported lazily so the embedded backend runs without pymongo installed
+    if backend == "mongodb":
+        from databaseManager import MongoDBManager
+        return MongoDBManager(connection_uri=CONNECTION_URI, database_name=DATABASE_NAME)
+    if backend == "embedded":
+        from embeddedStorage import EmbeddedStorage
+        return EmbeddedStorage(EMBEDDED_STORE_DIR)
+    raise ValueError(f"Unknown storage backend '{backend}', expected one of {STORAGE_BACKENDS}")
+
+class StorageBackend(ABC):
+    """Persons (bounded embedding prototypes plus running totals) and their face observations."""
+
+    # --- Persons ---
+
+    @abstractmethod
+    def save_new_person(self, embedding, name_label=None, image_path=None, bbox=None, confidence=None):
+        """Create a person from one face embedding and return the new person ID."""
+
+    @abstractmethod
+    def add_embedding_to_person(self, person_id, embedding, image_path, bbox=None, confidence=None):
+        """Record a face of an existing person and update the representative embedding."""
+
+    @abstractmethod
+    def getPerson(self, person_id):
+        """Return name_label, embeddings, representative_embedding and representative_image_paths."""
+
+    @abstractmethod
+    def update_person_name(self, person_id, new_name):
+        """Set a person's name label; returns False if the person does not exist."""
+
+    @abstractmethod
+    def merge_persons(self, target_id, source_ids):
+        """Fold source persons and their faces into the target person."""
+
+    @abstractmethod
+    def get_all_persons(self):
+        """Return every person as getPerson would, keyed by person ID."""
+
+    @abstractmethod
+    def get_person_labels(self, person_ids):
+        """Return {person_id: name_label} for the given IDs without loading any embeddings."""
+
+    # --- GUI listing ---
+
+    @abstractmethod
+    def count_persons(self, search=None):
+        """Count persons, optionally only those whose name or ID starts with search."""
+
+    @abstractmethod
+    def get_persons_page(self, page=0, page_size=50, search=None, after_person_id=None):
+        """Return one page of person_id/name_label/image_count/preview_image_path rows."""
+
+    @abstractmethod
+    def get_person_rows(self, person_ids):
+        """Return rows as in get_persons_page for the given IDs, keyed by person ID."""
+
+    @abstractmethod
+    def get_total_image_count(self):
+        """Total number of face images managed across all persons."""
+
+    # --- Representative embeddings ---
+
+    @abstractmethod
+    def get_representative_embedding(self, person_id):
+        """Return a person's representative embedding, or None if the person does not exist."""
+
+    @abstractmethod
+    def get_representative_changes(self, since_version=0):
+        """Return (changed, deleted, version) for incremental snapshot refreshes."""
+
+    @abstractmethod
+    def get_store_id(self):
+        """Return an ID that identifies this store's data, so snapshots of another store are not reused."""
+
+    # --- Face observations ---
+
+    @abstractmethod
+    def get_faces_in_image(self, image_path):
+        """Return every face observation recorded for an image."""
+
+    @abstractmethod
+    def remove_face(self, face_id):
+        """Remove one face observation and take its embedding out of the person's aggregates."""
+
+    @abstractmethod
+    def copy_faces_to_image(self, original_path, duplicate_path):
+        """Record a duplicate image as showing the same faces as its original."""
+
+    # --- Maintenance ---
+
+    @abstractmethod
+    def compact_person(self, person_id, strategy=None):
+        """Shrink a person's stored embeddings to the cap."""
+
+    @abstractmethod
+    def compact_all_persons(self, strategy=None):
+        """Compact every person over the embedding cap; returns how many were compacted."""
+
+    @abstractmethod
+    def close(self):
+        """Release the connection or files held by the backend."""
+
+    def remove_faces_for_image(self, image_path):
+        """Remove every face observation of an image, e.g. before reprocessing it."""
+        faces = self.get_faces_in_image(image_path)
+        for face in faces:
+            self.remove_face(face["face_id"])
+        return len(faces)
+
+    def refresh_embedding_snapshot(self, snapshot_dir=SNAPSHOT_DIR):
+        """Bring the on-disk embedding snapshot up to date and write it out."""
+        snapshot = EmbeddingSnapshot(snapshot_dir)
+        snapshot.refresh(self, persist=True)
+        print(f"Embedding snapshot at '{snapshot_dir}' holds {len(snapshot)} person(s) at version {snapshot.version}.")
+        return snapshot
+
+    def _merge_source_ids(self, target_id, source_ids):
+        """Validate the source persons of a merge: at least one, distinct, and not the target."""
+        source_ids = list(source_ids)
+        if not source_ids:
+            raise ValueError("No source persons given")
+        if len(set(source_ids)) != len(source_ids):
+            raise ValueError("Source persons must not repeat")
+        if target_id in source_ids:
+            raise ValueError(f"Target person {target_id} cannot also be a source")
+        return source_ids
+
+    def _over_cap(self, stored_count, embedding_count, strategy=None):
+        """Whether a person stores more embeddings than the compaction strategy allows.
+
+        "centroid" stores the first max_embeddings embeddings and none once the running
+        count exceeds the cap; the other strategies keep up to the cap.
+        """
+        if (strategy or self.compaction_strategy) == "centroid" and embedding_count > self.max_embeddings:
+            return stored_count > 0
+        return stored_count > self.max_embeddings
+
+    def _kmedoid_indices(self, embeddings, k, iterations=10):
+        """Pick the indices of k medoid embeddings by cosine distance."""
+        indices = list(range(len(embeddings)))
+        if len(embeddings) <= k:
+            return indices
+        # Bound the O(n^2) distance matrix for very large legacy documents
+        if len(indices) > 8 * k:
+            indices = random.sample(indices, 8 * k)
+
+        stacked = torch.stack([self._list_to_tensor(embeddings[i]) for i in indices], dim=0).float()
+        normalized = torch.nn.functional.normalize(stacked, p=2, dim=1)
+        distances = 1 - normalized @ normalized.T
+
+        # Farthest-point initialization starting from the most central embedding
+        medoids = [int(torch.argmin(distances.sum(dim=1)))]
+        nearest = distances[medoids[0]].clone()
+        while len(medoids) < k:
+            candidate = int(torch.argmax(nearest))
+            medoids.append(candidate)
+            nearest = torch.minimum(nearest, distances[candidate])
+
+        for _ in range(iterations):
+            assignment = distances[:, medoids].argmin(dim=1)
+            updated = []
+            for cluster, medoid in enumerate(medoids):
+                members = (assignment == cluster).nonzero(as_tuple=True)[0]
+                if len(members) == 0:
+                    updated.append(medoid)
+                    continue
+                cost = distances[members][:, members].sum(dim=1)
+                updated.append(int(members[torch.argmin(cost)]))
+            if updated == medoids:
+                break
+            medoids = updated
+
+        return [indices[i] for i in medoids]
+
+    def _kmedoid_prototypes(self, embeddings, k, iterations=10):
+        """Pick k medoid embeddings by cosine distance as the stored prototypes."""
+        return [embeddings[i] for i in self._kmedoid_indices(embeddings, k, iterations)]
+
+    def _tensor_to_list(self, tensor):
+        """Convert a PyTorch tensor to a list for storage."""
+        try:
+            if isinstance(tensor, torch.Tensor):
+                return tensor.cpu().numpy().tolist()
+            elif isinstance(tensor, np.ndarray):
+                return tensor.tolist()
+            elif isinstance(tensor, list):
+                return tensor
+            else:
+                raise ValueError(f"Unsupported tensor type: {type(tensor)}")
+        except Exception as e:
+            print(f"Error converting tensor to list: {e}")
+            raise
+
+    def _list_to_tensor(self, lst):
+        """Convert a stored list or array to a PyTorch tensor."""
+        try:
+            return torch.tensor(lst, device=DEVICE)
+        except Exception as e:
+            print(f"Error converting list to tensor: {e}")
+            raise
@@ -0,0 +1,122 @@
+# Benchmark of the storage backends: ingestion and GUI query latency on synthetic data
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from contextlib import redirect_stdout
+import numpy as np
+import torch
+from storageBackend import STORAGE_BACKENDS
+from config import CONNECTION_URI, DATABASE_NAME, PERSONS_PAGE_SIZE
+
+def open_backend(name, args, scratch_dir):
+    """Open a backend on scratch storage so the benchmark never touches real data."""
+    if name == "mongodb":
+        from databaseManager import MongoDBManager
+        return MongoDBManager(connection_uri=args.mongo_uri, database_name=args.mongo_database)
+    from embeddedStorage import EmbeddedStorage
+    return EmbeddedStorage(os.path.join(scratch_dir, "face_store"))
+
+def discard_backend(name, db_manager, args):
+    """Drop the scratch data of a backend and close it."""
+    if name == "mongodb":
+        db_manager.client.drop_database(args.mongo_database)
+    db_manager.close()
+
+def synthetic_faces(persons, faces_per_person, dim, seed):
+    """Yield (person index, face index, embedding): noisy copies of one random center per person."""
+    rng = np.random.default_rng(seed)
+    for person in range(persons):
+        center = rng.standard_normal(dim).astype(np.float32)
+        center /= np.linalg.norm(center)
+        for face in range(faces_per_person):
+            embedding = center + 0.1 * rng.standard_normal(dim).astype(np.float32)
+            yield person, face, torch.from_numpy(embedding / np.linalg.norm(embedding))
+
+def timed(latencies, operation, call, *args, **kwargs):
+    """Run one call and record its latency under operation."""
+    started = time.perf_counter()
+    result = call(*args, **kwargs)
+    latencies.setdefault(operation, []).append(time.perf_counter() - started)
+    return result
+
+def run_backend(name, args, scratch_dir):
+    """Ingest the synthetic data set, then run GUI queries; returns {operation: latencies}."""
+    latencies = {}
+    # Backends print a line per write; keep the report readable
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        db_manager = open_backend(name, args, scratch_dir)
+        try:
+            person_ids = []
+            for person, face, embedding in synthetic_faces(args.persons, args.faces_per_person, args.dim, args.seed):
+                image_path = f"/benchmark/{person}_{face}.jpg"
+                if face == 0:
+                    person_ids.append(timed(latencies, "save_new_person", db_manager.save_new_person, embedding,
+                                            image_path=image_path, bbox=[0, 0, 64, 64], confidence=0.9))
+                else:
+                    timed(latencies, "add_embedding_to_person", db_manager.add_embedding_to_person, person_ids[person],
+                          embedding, image_path, bbox=[0, 0, 64, 64], confidence=0.9)
+            for i, person_id in enumerate(person_ids[::10]):
+                timed(latencies, "update_person_name", db_manager.update_person_name, person_id, f"Person_{i}")
+
+            rng = random.Random(args.seed)
+            pages = max(1, len(person_ids) // PERSONS_PAGE_SIZE)
+            for _ in range(args.repeats):
+                timed(latencies, "count_persons", db_manager.count_persons)
+                timed(latencies, "count_persons(search)", db_manager.count_persons, "Person_1")
+                rows = timed(latencies, "get_persons_page", db_manager.get_persons_page, rng.randrange(pages), PERSONS_PAGE_SIZE)
+                timed(latencies, "get_person_rows", db_manager.get_person_rows, [row["person_id"] for row in rows])
+                timed(latencies, "get_person_labels", db_manager.get_person_labels, rng.sample(person_ids, min(16, len(person_ids))))
+                timed(latencies, "getPerson", db_manager.getPerson, rng.choice(person_ids))
+                timed(latencies, "get_total_image_count", db_manager.get_total_image_count)
+            for _ in range(max(1, args.repeats // 10)):
+                # Full fetch a process makes when it builds its embedding snapshot
+                timed(latencies, "get_representative_changes(0)", db_manager.get_representative_changes)
+        finally:
+            discard_backend(name, db_manager, args)
+    return latencies
+
+def summarize(values):
+    """Return (p50 ms, p99 ms) of a list of latencies in seconds."""
+    return np.percentile(values, 50) * 1000, np.percentile(values, 99) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ingestion and GUI query latency of the storage backends.")
+    parser.add_argument("--backend", choices=STORAGE_BACKENDS, action="append",
+                        help="Backend to benchmark (repeat for several; default: all).")
+    parser.add_argument("--persons", type=int, default=1000)
+    parser.add_argument("--faces-per-person", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--repeats", type=int, default=200, help="Repetitions of each GUI query.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mongo-uri", default=CONNECTION_URI)
+    parser.add_argument("--mongo-database", default=f"{DATABASE_NAME}_benchmark",
+                        help="Scratch database, dropped after the run.")
+    args = parser.parse_args()
+    if args.mongo_database == DATABASE_NAME:
+        parser.error("--mongo-database must not be the application database; it is dropped after the run")
+
+    results = {}
+    scratch_dir = tempfile.mkdtemp(prefix="storage_benchmark_")
+    try:
+        for name in args.backend or STORAGE_BACKENDS:
+            print(f"Benchmarking {name} with {args.persons} persons x {args.faces_per_person} faces...")
+            results[name] = run_backend(name, args, scratch_dir)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    names = list(results)
+    print(f"{'operation':<32}" + "".join(f"{name + ' p50':>16}{name + ' p99':>16}" for name in names))
+    operations = list(dict.fromkeys(op for latencies in results.values() for op in latencies))
+    for operation in operations:
+        cells = []
+        for name in names:
+            values = results[name].get(operation)
+            p50, p99 = summarize(values) if values else (float("nan"), float("nan"))
+            cells.append(f"{p50:>13.3f} ms{p99:>13.3f} ms")
+        print(f"{operation:<32}" + "".join(cells))
+
+if __name__ == "__main__":
+    main()
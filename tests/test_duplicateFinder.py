@@ -0,0 +1,80 @@
+import numpy as np
+from duplicateFinder import DuplicateFinder
+
+class FakeStore:
+    def __init__(self):
+        self.embeddings = {}
+        self.deleted = {}
+        self.versions = {}
+        self.version = 0
+        self.requests = []
+
+    def set(self, person_id, embedding):
+        self.version += 1
+        self.embeddings[person_id] = np.asarray(embedding, dtype=np.float32)
+        self.versions[person_id] = self.version
+
+    def delete(self, person_id):
+        self.version += 1
+        del self.embeddings[person_id]
+        self.deleted[person_id] = self.version
+
+    def get_representative_changes(self, since_version=0):
+        self.requests.append(since_version)
+        changed = {pid: emb for pid, emb in self.embeddings.items() if self.versions[pid] > since_version}
+        deleted = [pid for pid, version in self.deleted.items() if since_version and version > since_version]
+        return changed, deleted, self.version
+
+def unit(angle):
+    return [np.cos(angle), np.sin(angle)]
+
+def test_refresh_fetches_only_changes_and_drops_deleted():
+    store = FakeStore()
+    store.set("A", unit(0.0))
+    store.set("B", unit(0.1))
+    store.set("C", unit(2.0))
+    finder = DuplicateFinder(store, similarity_threshold=0.9)
+
+    finder.refresh()
+    assert [pair["person_ids"] for pair in finder.get_pairs()] == [["A", "B"]]
+
+    store.set("C", unit(0.05))
+    finder.refresh()
+    assert store.requests == [0, 3]
+    assert {tuple(pair["person_ids"]) for pair in finder.get_pairs()} == {("A", "B"), ("A", "C"), ("B", "C")}
+
+    store.delete("B")
+    finder.refresh()
+    assert [pair["person_ids"] for pair in finder.get_pairs()] == [["A", "C"]]
+
+def test_groups_are_cliques():
+    store = FakeStore()
+    # A~B and B~C are above the threshold (A~B is stronger), A~C is not
+    store.set("A", unit(0.0))
+    store.set("B", unit(0.35))
+    store.set("C", unit(0.8))
+    finder = DuplicateFinder(store, similarity_threshold=0.9)
+    finder.refresh()
+
+    groups = finder.get_groups()
+    assert [group["person_ids"] for group in groups] == [["A", "B"]]
+    assert groups[0]["similarity"] > 0.9
+
+    store.set("D", unit(0.02))
+    finder.refresh()
+    for group in finder.get_groups():
+        members = group["person_ids"]
+        assert not {"A", "C"} <= set(members)
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                assert (a, b) in finder._pairs
+
+def test_refresh_async_is_throttled():
+    store = FakeStore()
+    store.set("A", unit(0.0))
+    finder = DuplicateFinder(store, refresh_seconds=3600)
+    assert finder.refresh_async()
+    finder._thread.join()
+    assert not finder.refresh_async()
+    assert finder.refresh_async(force=True)
+    finder._thread.join()
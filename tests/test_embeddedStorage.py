@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+import embeddedStorage
+from embeddedStorage import EmbeddedStorage
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def representative(store, person_id):
+    return store.get_representative_embedding(person_id).cpu().numpy()
+
+@pytest.fixture
+def store(tmp_path):
+    store = EmbeddedStorage(str(tmp_path / "store"), max_embeddings=3, compaction_strategy="reservoir")
+    yield store
+    store.close()
+
+def test_representative_is_normalized_mean(store):
+    a, b = unit(1, 0, 0), unit(0, 1, 0)
+    person_id = store.save_new_person(a, image_path="a.jpg", bbox=[0, 0, 10, 10], confidence=0.9)
+    store.add_embedding_to_person(person_id, b, "b.jpg", bbox=[0, 0, 10, 10], confidence=0.8)
+
+    assert np.allclose(representative(store, person_id), unit(1, 1, 0))
+    person = store.getPerson(person_id)
+    assert person["representative_image_paths"] == ["a.jpg", "b.jpg"]
+    assert len(person["embeddings"]) == 2
+    assert store.get_total_image_count() == 2
+    # Committed rows were flushed to disk before the commit
+    assert not store.matrix._dirty
+
+def test_rolled_back_write_keeps_committed_rows(store):
+    a = unit(1, 0, 0)
+    person_id = store.save_new_person(a, image_path="a.jpg")
+    store.add_embedding_to_person(person_id, unit(0, 1, 0), "b.jpg")
+    before = representative(store, person_id)
+
+    # The face insert fails after the sum row was replaced and a prototype stored
+    with pytest.raises(ValueError):
+        store.add_embedding_to_person(person_id, unit(0, 0, 1), "c.jpg", bbox=["not a number"])
+
+    assert np.allclose(representative(store, person_id), before)
+    assert len(store.getPerson(person_id)["embeddings"]) == 2
+    assert store.get_faces_in_image("c.jpg") == []
+
+    # Rows freed by committed transactions are reused afterwards
+    store.add_embedding_to_person(person_id, unit(0, 0, 1), "c.jpg")
+    assert np.allclose(representative(store, person_id), unit(1, 1, 1))
+    assert store.conn.execute("SELECT COUNT(*) FROM free_rows WHERE pending = 1").fetchone()[0] == 0
+
+def test_merge_and_remove_face(store):
+    a, b = unit(1, 0, 0), unit(0, 1, 0)
+    target = store.save_new_person(a, image_path="a.jpg")
+    source = store.save_new_person(b, image_path="b.jpg")
+    _, _, version = store.get_representative_changes()
+
+    store.merge_persons(target, [source])
+    changed, deleted, _ = store.get_representative_changes(version)
+    assert list(changed) == [target] and deleted == [source]
+    assert np.allclose(changed[target], unit(1, 1, 0))
+    assert store.count_persons() == 1
+
+    assert store.remove_faces_for_image("b.jpg") == 1
+    assert np.allclose(representative(store, target), a)
+
+def test_merge_rejects_repeated_or_target_sources(store):
+    target = store.save_new_person(unit(1, 0, 0), image_path="a.jpg")
+    source = store.save_new_person(unit(0, 1, 0), image_path="b.jpg")
+    for source_ids in ([source, source], [target, source], []):
+        with pytest.raises(ValueError):
+            store.merge_persons(target, source_ids)
+    assert store.count_persons() == 2
+
+def test_matrix_spans_segments_shared_between_instances(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddedStorage, "SEGMENT_ROWS", 4)
+    writer = EmbeddedStorage(str(tmp_path / "store"))
+    reader = EmbeddedStorage(str(tmp_path / "store"))
+    try:
+        rng = np.random.default_rng(0)
+        vectors = {writer.save_new_person(vector): vector for vector in rng.standard_normal((3, 8)).astype(np.float32)}
+        assert reader.count_persons() == 3
+
+        # Later persons land in segments the reader has not mapped yet
+        vectors.update({writer.save_new_person(vector): vector
+                        for vector in rng.standard_normal((10, 8)).astype(np.float32)})
+        assert len(list((tmp_path / "store" / embeddedStorage.EMBEDDINGS_DIRNAME).iterdir())) > 2
+        representatives, _, _ = reader.get_representative_changes()
+        for person_id, vector in vectors.items():
+            assert np.allclose(representatives[person_id], vector / np.linalg.norm(vector), atol=1e-6)
+    finally:
+        reader.close()
+        writer.close()
+
+def test_centroid_mode_stops_storing_past_the_cap(tmp_path):
+    store = EmbeddedStorage(str(tmp_path / "store"), max_embeddings=3, compaction_strategy="centroid")
+    try:
+        rng = np.random.default_rng(1)
+        vectors = rng.standard_normal((6, 4)).astype(np.float32)
+        person_id = store.save_new_person(vectors[0])
+        for vector in vectors[1:3]:
+            store.add_embedding_to_person(person_id, vector, "a.jpg")
+        assert len(store.getPerson(person_id)["embeddings"]) == 3
+        assert store.compact_person(person_id) is False
+
+        for vector in vectors[3:]:
+            store.add_embedding_to_person(person_id, vector, "b.jpg")
+        assert store.getPerson(person_id)["embeddings"] == []
+        assert store.compact_all_persons() == 0
+        assert np.allclose(representative(store, person_id), unit(*vectors.sum(axis=0)), atol=1e-6)
+    finally:
+        store.close()
@@ -0,0 +1,138 @@
+import os
+import numpy as np
+from embeddingSnapshot import EmbeddingSnapshot, INDEX_FILENAME
+
+class FakeStore:
+    def __init__(self, store_id="store-a"):
+        self.store_id = store_id
+        self.embeddings = {}
+        self.versions = {}
+        self.deleted = {}
+        self.version = 0
+
+    def set(self, person_id, embedding):
+        self.version += 1
+        self.embeddings[person_id] = np.asarray(embedding, dtype=np.float32)
+        self.versions[person_id] = self.version
+
+    def delete(self, person_id):
+        self.version += 1
+        del self.embeddings[person_id]
+        self.deleted[person_id] = self.version
+
+    def get_store_id(self):
+        return self.store_id
+
+    def get_representative_changes(self, since_version=0):
+        changed = {pid: emb for pid, emb in self.embeddings.items() if self.versions[pid] > since_version}
+        deleted = [pid for pid, version in self.deleted.items() if since_version and version > since_version]
+        return changed, deleted, self.version
+
+def best(snapshot, query):
+    return snapshot.match([query], -1)[0][0]
+
+def data_files(snapshot_dir):
+    return sorted(name for name in os.listdir(snapshot_dir) if name.endswith(".f32"))
+
+def test_persisted_snapshot_is_shared_with_other_readers(tmp_path):
+    store = FakeStore()
+    store.set("A", [1, 0, 0])
+    store.set("B", [0, 1, 0])
+    writer = EmbeddingSnapshot(str(tmp_path))
+    writer.refresh(store, persist=True)
+
+    reader = EmbeddingSnapshot(str(tmp_path))
+    assert reader.load()
+    assert len(reader) == 2 and reader.version == 2 and reader.store_id == "store-a"
+    assert best(reader, [0.9, 0.1, 0]) == "A"
+
+    # Unchanged rows resent by the store do not enter the overlay
+    assert not reader.refresh(store, persist=False)
+
+def test_overlay_and_removals_are_folded_in_by_persist(tmp_path):
+    store = FakeStore()
+    store.set("A", [1, 0, 0])
+    store.set("B", [0, 1, 0])
+    snapshot = EmbeddingSnapshot(str(tmp_path))
+    snapshot.refresh(store, persist=True)
+    first_file = data_files(tmp_path)
+
+    snapshot.update_local("C", [0, 0, 2])
+    snapshot.update_local("A", [0, 1, 1])
+    snapshot.remove_local("B")
+    assert len(snapshot) == 2
+    assert best(snapshot, [0, 0, 1]) == "C"
+    assert best(snapshot, [0, 1, 0]) == "A"
+
+    snapshot.persist()
+    assert data_files(tmp_path) != first_file and len(data_files(tmp_path)) == 1
+    reader = EmbeddingSnapshot(str(tmp_path))
+    reader.load()
+    assert sorted(reader.person_ids) == ["A", "C"]
+    assert np.allclose(reader.matrix[reader.person_ids.index("C")], [0, 0, 1])
+
+def test_deletions_from_the_store_hide_persons(tmp_path):
+    store = FakeStore()
+    store.set("A", [1, 0, 0])
+    store.set("B", [0, 1, 0])
+    snapshot = EmbeddingSnapshot(str(tmp_path))
+    snapshot.refresh(store, persist=True)
+
+    store.delete("A")
+    assert snapshot.refresh(store, persist=False)
+    assert best(snapshot, [1, 0, 0]) == "B"
+
+def test_snapshot_of_another_store_is_discarded(tmp_path):
+    first = FakeStore("store-a")
+    for i in range(5):
+        first.set(f"A{i}", np.eye(4)[i % 4])
+    EmbeddingSnapshot(str(tmp_path)).refresh(first, persist=True)
+
+    second = FakeStore("store-b")
+    second.set("B0", [1, 0, 0, 0])
+    snapshot = EmbeddingSnapshot(str(tmp_path))
+    snapshot.load()
+    snapshot.refresh(second)
+    assert snapshot.person_ids == ["B0"] and snapshot.store_id == "store-b"
+
+    # The rebuilt snapshot is published and other readers of the old store ignore it
+    stale = EmbeddingSnapshot(str(tmp_path))
+    stale.store_id = "store-a"
+    assert not stale.load()
+
+def test_snapshot_ahead_of_the_store_is_rebuilt(tmp_path):
+    store = FakeStore()
+    for i in range(5):
+        store.set(f"P{i}", np.eye(5)[i])
+    EmbeddingSnapshot(str(tmp_path)).refresh(store, persist=True)
+
+    # Same store identity, but the data was dropped and the counter restarted
+    dropped = FakeStore()
+    dropped.set("Q", [1, 0, 0, 0, 0])
+    snapshot = EmbeddingSnapshot(str(tmp_path))
+    snapshot.refresh(dropped)
+    assert snapshot.person_ids == ["Q"] and snapshot.version == 1
+
+def test_load_reads_the_index_again_when_its_data_file_was_replaced(tmp_path):
+    store = FakeStore()
+    store.set("A", [1, 0, 0])
+    writer = EmbeddingSnapshot(str(tmp_path))
+    writer.refresh(store, persist=True)
+    stale_index = EmbeddingSnapshot(str(tmp_path))._read_index()
+
+    store.set("B", [0, 1, 0])
+    writer.refresh(store, persist=True)
+    assert not os.path.exists(tmp_path / stale_index["data_file"])
+
+    reader = EmbeddingSnapshot(str(tmp_path))
+    indexes = [stale_index]
+    original = reader._read_index
+    reader._read_index = lambda: indexes.pop() if indexes else original()
+    assert reader.load()
+    assert sorted(reader.person_ids) == ["A", "B"]
+
+def test_load_without_an_index(tmp_path):
+    snapshot = EmbeddingSnapshot(str(tmp_path / "missing"))
+    assert not snapshot.load()
+    assert not os.path.exists(tmp_path / "missing" / INDEX_FILENAME)
+    assert snapshot.match([[1, 0]], 0.5) == [(None, -1.0)]
@@ -0,0 +1,63 @@
+import numpy as np
+from PIL import Image
+from imageDedup import DedupIndex, content_hash, dhash
+
+def gradient_image(path, flip=False, noise=0):
+    values = np.tile(np.linspace(0, 255, 64), (64, 1))
+    if flip:
+        values = values[:, ::-1]
+    if noise:
+        values = values + np.random.default_rng(0).uniform(-noise, noise, values.shape)
+    Image.fromarray(np.clip(values, 0, 255).astype(np.uint8), "L").save(path)
+    return str(path)
+
+def register(index, path, destinations=("out/a",)):
+    index.add(path, (content_hash(path), dhash(path)), list(destinations))
+
+def test_exact_and_near_duplicates(tmp_path):
+    index = DedupIndex(max_distance=4)
+    original = gradient_image(tmp_path / "original.png")
+    register(index, original)
+
+    copy = tmp_path / "copy.png"
+    copy.write_bytes(open(original, "rb").read())
+    kind, match, _ = index.find_duplicate(str(copy))
+    assert (kind, match) == ("exact", original)
+
+    kind, match, _ = index.find_duplicate(gradient_image(tmp_path / "noisy.png", noise=2))
+    assert (kind, match) == ("near", original)
+    assert index.get_assignments(original) == ["out/a"]
+
+def test_unrelated_image_is_not_a_duplicate(tmp_path):
+    index = DedupIndex(max_distance=4)
+    register(index, gradient_image(tmp_path / "original.png"))
+    kind, match, hashes = index.find_duplicate(gradient_image(tmp_path / "flipped.png", flip=True))
+    assert kind is None and match is None
+    assert hashes[1] is not None
+
+def test_image_never_matches_itself(tmp_path):
+    index = DedupIndex(max_distance=4)
+    original = gradient_image(tmp_path / "original.png")
+    register(index, original)
+    kind, match, _ = index.find_duplicate(original)
+    assert kind is None and match is None
+
+def test_remove_forgets_a_changed_file(tmp_path):
+    index = DedupIndex(max_distance=4)
+    original = gradient_image(tmp_path / "original.png")
+    register(index, original)
+    other = tmp_path / "other.png"
+    other.write_bytes(open(original, "rb").read())
+
+    index.remove(original)
+    assert index.get_assignments(original) is None
+    assert index.find_duplicate(str(other))[0] is None
+    assert all(not buckets for buckets in index._near)
+
+    # Re-registering the rewritten file replaces its old hashes
+    gradient_image(tmp_path / "original.png", flip=True)
+    register(index, original, ["out/b"])
+    register(index, original, ["out/b"])
+    assert index.find_duplicate(str(other))[0] is None
+    assert sum(len(entries) for buckets in index._near for entries in buckets.values()) == len(index._bands)
+    assert index.get_assignments(original) == ["out/b"]
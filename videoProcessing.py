@@ -0,0 +1,195 @@
+# Video ingestion: adaptive frame sampling, batched detection and IoU face tracking
+import heapq
+import itertools
+import cv2
+import numpy as np
+import torch
+from faceProcessing import detect_faces_yolo_batch, get_face_embeddings_batch, identify_person
+from config import (SIMILARITY_THRESHOLD, VIDEO_FRAME_STRIDE, VIDEO_SCENE_CHECK_INTERVAL, VIDEO_SCENE_CHANGE_THRESHOLD,
+                    VIDEO_BATCH_SIZE, VIDEO_IOU_THRESHOLD, VIDEO_MAX_TRACK_GAP, VIDEO_MIN_TRACK_LENGTH,
+                    VIDEO_FRAMES_PER_TRACK)
+
+def box_iou(box_a, box_b):
+    """Intersection over union of two [x1, y1, x2, y2] boxes."""
+    x1, y1 = max(box_a[0], box_b[0]), max(box_a[1], box_b[1])
+    x2, y2 = min(box_a[2], box_b[2]), min(box_a[3], box_b[3])
+    intersection = max(0, x2 - x1) * max(0, y2 - y1)
+    area_a = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1])
+    area_b = (box_b[2] - box_b[0]) * (box_b[3] - box_b[1])
+    union = area_a + area_b - intersection
+    return intersection / union if union > 0 else 0.0
+
+class FaceTrack:
+    _tiebreak = itertools.count()
+
+    def __init__(self, track_id, frame_index, bbox, max_candidates):
+        """A face followed across sampled frames, keeping only its best few crops."""
+        self.track_id = track_id
+        self.bbox = bbox
+        self.first_frame = frame_index
+        self.last_frame = frame_index
+        self.length = 0
+        self.max_candidates = max_candidates
+        self._candidates = []  # min-heap of (score, tiebreak, crop, bbox, confidence)
+
+    def add(self, frame_index, bbox, confidence, frame):
+        """Extend the track with a detection, keeping the crop if it is among the best."""
+        self.bbox = bbox
+        self.last_frame = frame_index
+        self.length += 1
+
+        x1, y1, x2, y2 = bbox
+        if x1 >= x2 or y1 >= y2:
+            return
+        # Prefer confident, large faces
+        score = confidence * ((x2 - x1) * (y2 - y1)) ** 0.5
+        if len(self._candidates) < self.max_candidates:
+            heapq.heappush(self._candidates, (score, next(self._tiebreak), frame[y1:y2, x1:x2].copy(), bbox, confidence))
+        elif score > self._candidates[0][0]:
+            heapq.heapreplace(self._candidates, (score, next(self._tiebreak), frame[y1:y2, x1:x2].copy(), bbox, confidence))
+
+    def best_candidates(self):
+        """Kept (crop, bbox, confidence) tuples, best first."""
+        return [(crop, bbox, confidence) for _, _, crop, bbox, confidence in sorted(self._candidates, reverse=True)]
+
+class IoUTracker:
+    def __init__(self, iou_threshold=VIDEO_IOU_THRESHOLD, max_gap=VIDEO_MAX_TRACK_GAP, max_candidates=VIDEO_FRAMES_PER_TRACK):
+        """Greedy IoU association of detections to tracks across sampled frames."""
+        self.iou_threshold = iou_threshold
+        self.max_gap = max_gap
+        self.max_candidates = max_candidates
+        self.active = []
+        self._next_id = 0
+
+    def update(self, frame_index, detections, frame):
+        """Associate one frame's (bbox, confidence) detections; returns tracks that have ended."""
+        pairs = sorted(
+            ((box_iou(track.bbox, bbox), t, d) for t, track in enumerate(self.active) for d, (bbox, _) in enumerate(detections)),
+            reverse=True
+        )
+        matched_tracks, matched_detections = set(), set()
+        for iou, t, d in pairs:
+            if iou < self.iou_threshold:
+                break
+            if t in matched_tracks or d in matched_detections:
+                continue
+            matched_tracks.add(t)
+            matched_detections.add(d)
+            bbox, confidence = detections[d]
+            self.active[t].add(frame_index, bbox, confidence, frame)
+
+        for d, (bbox, confidence) in enumerate(detections):
+            if d not in matched_detections:
+                track = FaceTrack(self._next_id, frame_index, bbox, self.max_candidates)
+                track.add(frame_index, bbox, confidence, frame)
+                self._next_id += 1
+                self.active.append(track)
+
+        ended = [track for track in self.active if frame_index - track.last_frame > self.max_gap]
+        self.active = [track for track in self.active if frame_index - track.last_frame <= self.max_gap]
+        return ended
+
+    def flush(self):
+        """End and return every active track."""
+        ended, self.active = self.active, []
+        return ended
+
+def _scene_signature(frame):
+    """Tiny grayscale thumbnail used for cheap scene-change checks."""
+    return cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+def identify_tracks(tracks, video_path, similarity_threshold=SIMILARITY_THRESHOLD, min_track_length=VIDEO_MIN_TRACK_LENGTH):
+    """Embed each track's best crops in one batch and identify one person per track."""
+    tracks = [track for track in tracks if track.length >= min_track_length and track.best_candidates()]
+    if not tracks:
+        return []
+
+    crops, owners = [], []
+    for t, track in enumerate(tracks):
+        for crop, _, _ in track.best_candidates():
+            crops.append(crop)
+            owners.append(t)
+    embeddings = get_face_embeddings_batch(crops)
+    if embeddings is None:
+        return []
+
+    person_ids = []
+    owners = torch.tensor(owners, device=embeddings.device)
+    for t, track in enumerate(tracks):
+        # The averaged embedding of a track is steadier than any single frame
+        track_embedding = torch.nn.functional.normalize(embeddings[owners == t].mean(dim=0), p=2, dim=0)
+        _, best_bbox, best_confidence = track.best_candidates()[0]
+        person_id = identify_person(track_embedding, similarity_threshold, video_path, bbox=best_bbox, confidence=best_confidence)
+        if person_id:
+            person_ids.append(person_id)
+    return person_ids
+
+def process_video(video_path, similarity_threshold=SIMILARITY_THRESHOLD, frame_stride=VIDEO_FRAME_STRIDE,
+                  scene_check_interval=VIDEO_SCENE_CHECK_INTERVAL, scene_change_threshold=VIDEO_SCENE_CHANGE_THRESHOLD,
+                  batch_size=VIDEO_BATCH_SIZE):
+    """Identify the persons appearing in a video and record the video path for each of them.
+
+    Frames are decoded in a stream. Every frame_stride-th frame is sampled, and frames in
+    between are sampled early when a cheap thumbnail check sees a scene change. Sampled
+    frames go through YOLO in batches, detections are linked into tracks, and FaceNet runs
+    only on the best few crops of each track.
+    """
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video {video_path}")
+
+    tracker = IoUTracker()
+    result = {"frames_read": 0, "frames_sampled": 0, "tracks": 0, "person_ids": set()}
+    pending_frames, pending_indices = [], []
+    last_signature = None
+    frame_index = -1
+
+    def run_batch():
+        detections = detect_faces_yolo_batch(pending_frames, with_confidence=True)
+        ended = []
+        for index, frame, frame_detections in zip(pending_indices, pending_frames, detections):
+            ended.extend(tracker.update(index, frame_detections, frame))
+        pending_frames.clear()
+        pending_indices.clear()
+        return ended
+
+    try:
+        while True:
+            # grab() still decodes each frame with FFmpeg (inter-frame codecs need it); skipped
+            # frames only avoid the retrieve() color conversion copy and the scene check
+            if not capture.grab():
+                break
+            frame_index += 1
+            result["frames_read"] += 1
+
+            on_stride = frame_index % frame_stride == 0
+            if not on_stride and (not scene_check_interval or frame_index % scene_check_interval != 0):
+                continue
+            ok, frame = capture.retrieve()
+            if not ok:
+                continue
+
+            signature = _scene_signature(frame)
+            scene_changed = last_signature is not None and float(np.mean(np.abs(signature - last_signature))) >= scene_change_threshold
+            if not on_stride and not scene_changed:
+                continue
+            last_signature = signature
+
+            pending_frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            pending_indices.append(frame_index)
+            result["frames_sampled"] += 1
+
+            if len(pending_frames) >= batch_size:
+                ended = run_batch()
+                result["tracks"] += len(ended)
+                result["person_ids"].update(identify_tracks(ended, video_path, similarity_threshold))
+
+        ended = (run_batch() if pending_frames else []) + tracker.flush()
+        result["tracks"] += len(ended)
+        result["person_ids"].update(identify_tracks(ended, video_path, similarity_threshold))
+    finally:
+        capture.release()
+
+    print(f"Video {video_path}: sampled {result['frames_sampled']}/{result['frames_read']} frames, "
+          f"{result['tracks']} face track(s), {len(result['person_ids'])} person(s).")
+    return result